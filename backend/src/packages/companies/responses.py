@@ -64,6 +64,22 @@ class TaskOut(SuccessResponse):
     payload: Task | None
 
 
+class BulkTask(BaseModel):
+    task_ids: list[str]
+    enqueued: list[int]
+    already_enqueued: list[int]
+    not_found: list[int]
+
+    model_config = ConfigDict(
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
+
+
+class BulkTaskOut(SuccessResponse):
+    payload: BulkTask | None
+
+
 class CreditRequest(BaseModel):
     id: int
     company_id: int
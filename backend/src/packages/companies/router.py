@@ -16,10 +16,12 @@ from databases.postgres import (
 )
 from packages.auth import auth_scheme
 
-from .schemas import CompanyInfo, CreditRequestInfo
+from .schemas import BulkScrapeInfo, CompanyInfo, CreditRequestInfo
 from .responses import (
     TaskOut,
     Task,
+    BulkTaskOut,
+    BulkTask,
     CreditRequest,
     CreditRequestList,
     CreditRequestOut,
@@ -32,6 +34,9 @@ from .responses import (
 
 company_router = APIRouter()
 
+# Companies per scrape_batch task, each batch shares one Supercias session
+BULK_BATCH_SIZE = 25
+
 
 @company_router.get("")
 async def get_all_company(
@@ -161,6 +166,7 @@ async def scrape_info(
     request: Request,
     response: Response,
     company_id: int,
+    force_refresh: bool = False,
     current_user=Depends(auth_scheme),
 ):
     request_id = request.state.request_id
@@ -208,6 +214,7 @@ async def scrape_info(
                     financial_info.id,
                     company.ruc,
                     company.ig_url,
+                    force_refresh,
                 ],
             )
 
@@ -228,6 +235,85 @@ async def scrape_info(
         )
 
 
+@company_router.post("/scrape-info/bulk")
+async def bulk_scrape_info(
+    request: Request,
+    response: Response,
+    bulk_info: BulkScrapeInfo,
+    current_user=Depends(auth_scheme),
+):
+    request_id = request.state.request_id
+    try:
+        with DatabaseSession() as db:
+            companies = (
+                db.query(CompanyDB)
+                .filter(CompanyDB.id.in_(bulk_info.company_ids))
+                .all()
+            )
+            found_ids = {company.id for company in companies}
+            not_found = [
+                company_id
+                for company_id in bulk_info.company_ids
+                if company_id not in found_ids
+            ]
+
+            pending_ids = {
+                company_id
+                for (company_id,) in db.query(FinancialInfoDB.company_id)
+                .filter(
+                    FinancialInfoDB.company_id.in_(found_ids)
+                    & (FinancialInfoDB.status == "PENDING")
+                )
+                .all()
+            }
+
+            items, enqueued = [], []
+            for company in companies:
+                if company.id in pending_ids:
+                    continue
+                financial_info = FinancialInfoDB(company_id=company.id)
+                db.add(financial_info)
+                db.flush()
+                items.append(
+                    [financial_info.id, company.ruc, company.ig_url]
+                )
+                enqueued.append(company.id)
+            db.commit()
+
+            task_ids = []
+            for start in range(0, len(items), BULK_BATCH_SIZE):
+                task = celery_app.send_task(
+                    "scrape_batch",
+                    args=[
+                        items[start : start + BULK_BATCH_SIZE],
+                        bulk_info.force_refresh,
+                    ],
+                )
+                task_ids.append(task.id)
+
+            logger.info(
+                f"{len(items)} companies enqueued in {len(task_ids)} batches"
+            )
+            return BulkTaskOut(
+                request_id=request_id,
+                process_time=0,
+                func="bulk_scrape_info",
+                message="Tasks enqueued",
+                payload=BulkTask(
+                    task_ids=task_ids,
+                    enqueued=enqueued,
+                    already_enqueued=sorted(pending_ids),
+                    not_found=not_found,
+                ),
+            )
+    except Exception as e:
+        logger.error(f"Error bulk scraping: {e}")
+        response.status_code = 500
+        return InternalServerErrorResponse(
+            request_id=request_id, message=str(e), func="bulk_scrape_info"
+        )
+
+
 @company_router.get("/credit-requests")
 async def get_all_credit_requests(
     request: Request,
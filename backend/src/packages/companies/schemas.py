@@ -18,3 +18,13 @@ class CompanyInfo(BaseModel):
 class CreditRequestInfo(BaseModel):
     company_id: int
     amount: float
+
+
+class BulkScrapeInfo(BaseModel):
+    company_ids: list[int]
+    force_refresh: bool = False
+
+    model_config = ConfigDict(
+        alias_generator=to_camel,
+        populate_by_name=True,
+    )
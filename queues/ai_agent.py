@@ -4,9 +4,10 @@ from statistics import mean
 from utils.results_reader import extract_sales_from_pdf
 from utils.cashflow_reader import extract_operating_cashflow_from_pdf
 from utils.pdf_reader import extract_financial_table_from_pdf
+from pdf_store import pdf_store
 
 SCORING_WEIGHTS = {
-    "average_ccash_flow": 0.20,
+    "average_cash_flow": 0.20,
     "debt_ratio": 0.10,
     "income_variability": 0.10,
     "platform_reviews": 0.10,
@@ -179,18 +180,14 @@ def _compute_scoring_breakdown(vals, social_json=None, overrides=None):
     posts_last_7 = _estimate_posts_last_7_days(social_json)
 
     candidates = {
-        "Flujo de caja promedio (últimos 6 meses)": _norm_cashflow(
-            cash_flow, sales
-        ),
-        "Nivel de endeudamiento": _score_leverage(liabilities, assets),
-        "Variabilidad en ingresos": _score_revenue_variability(None),
-        "Reseñas en plataformas (Google, Facebook)": _score_reviews_nlp(
-            sentiment
-        ),
-        "Actividad en redes sociales": _score_social_activity(posts_last_7),
-        "Historial con proveedores": _score_suppliers_history(None),
-        "Recomendaciones de clientes": _score_client_recos_nlp(None),
-        "Cumplimiento en pagos": _score_payment_behavior(None),
+        "average_cash_flow": _norm_cashflow(cash_flow, sales),
+        "debt_ratio": _score_leverage(liabilities, assets),
+        "income_variability": _score_revenue_variability(None),
+        "platform_reviews": _score_reviews_nlp(sentiment),
+        "social_media_activity": _score_social_activity(posts_last_7),
+        "suppliers_reviews": _score_suppliers_history(None),
+        "customer_reviews": _score_client_recos_nlp(None),
+        "payment_compliance": _score_payment_behavior(None),
     }
 
     breakdown = []
@@ -213,12 +210,20 @@ def _compute_scoring_breakdown(vals, social_json=None, overrides=None):
     return breakdown, total
 
 
-def analyze_company(uid: str):
-    base = Path("generated")
-    estado_pdf = base / f"{uid}-balance.pdf"
-    flujo_pdf = base / f"{uid}-flujo.pdf"
-    integral_pdf = base / f"{uid}-integral.pdf"
-    social_json_path = base / f"{uid}.json"
+def _statement_pdf(uid, kind, refs):
+    # The store is what a parse worker on another host shares with the
+    # scrapers; generated/ only holds links into it on the scraper's host
+    ref = refs.get(kind)
+    if ref and pdf_store.has(ref["sha256"]):
+        return Path(pdf_store.blob_path(ref["sha256"]))
+    return Path(pdf_store.generated_path) / f"{uid}-{kind}.pdf"
+
+
+def parse_statements(uid: str):
+    refs = pdf_store.refs("uid", uid)
+    estado_pdf = _statement_pdf(uid, "balance", refs)
+    flujo_pdf = _statement_pdf(uid, "flujo", refs)
+    integral_pdf = _statement_pdf(uid, "integral", refs)
 
     sales = (
         extract_sales_from_pdf(str(integral_pdf))
@@ -236,6 +241,25 @@ def analyze_company(uid: str):
         df = extract_financial_table_from_pdf(str(estado_pdf))
         assets, liabilities, equity = _extract_balance_items(df)
 
+    return {
+        "sales": sales,
+        "cash_flow": cash_flow,
+        "assets": assets,
+        "liabilities": liabilities,
+        "equity": equity,
+    }
+
+
+def score_company(uid: str, statements: dict):
+    base = Path(pdf_store.generated_path)
+    social_json_path = base / f"{uid}.json"
+
+    sales = statements.get("sales")
+    cash_flow = statements.get("cash_flow")
+    assets = statements.get("assets")
+    liabilities = statements.get("liabilities")
+    equity = statements.get("equity")
+
     current_solvency = (
         _safe_div(assets, liabilities) if assets and liabilities else None
     )
@@ -301,6 +325,10 @@ def analyze_company(uid: str):
     return vals
 
 
+def analyze_company(uid: str):
+    return score_company(uid, parse_statements(uid))
+
+
 def credit_decision(analysis_payload: dict, requested_amount: float):
     sales = float(analysis_payload.get("sales", 0.0) or 0.0)
     cash_flow = float(analysis_payload.get("cash_flow", 0.0) or 0.0)
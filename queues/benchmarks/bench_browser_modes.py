@@ -0,0 +1,120 @@
+"""
+Task wall time and browser memory for each way of running Chromium.
+
+Modes:
+    display_per_task  headed, new Xvfb + browser per task (old behaviour)
+    shared_display    headed, one Xvfb for the worker, warm browser
+    headless_new      new headless mode, no X server, warm browser
+
+Every mode keeps the playwright_stealth setup used by the worker.
+
+Usage (from /queues):
+    python -m benchmarks.bench_browser_modes --tasks 5 --url https://example.com
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from statistics import mean, median
+
+import psutil
+from playwright.async_api import async_playwright
+from playwright_stealth import Stealth
+
+from browser_launch import build_launch_options, WorkerDisplay
+
+MODES = ["display_per_task", "shared_display", "headless_new"]
+
+
+def tree_rss_mb():
+    # Worker process, Xvfb and every Chromium process it spawned
+    total = 0
+    me = psutil.Process()
+    for proc in [me] + me.children(recursive=True):
+        try:
+            total += proc.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / (1024 * 1024)
+
+
+async def visit(context, url):
+    page = await context.new_page()
+    await page.goto(url)
+    await page.close()
+
+
+async def run_cold(url, tasks, profile_dir):
+    timings, peak = [], 0.0
+    options = build_launch_options("headed")
+    for _ in range(tasks):
+        started = time.perf_counter()
+        display = WorkerDisplay()
+        display.start()
+        try:
+            async with Stealth().use_async(async_playwright()) as p:
+                context = await p.chromium.launch_persistent_context(
+                    user_data_dir=profile_dir, **options
+                )
+                try:
+                    await visit(context, url)
+                    peak = max(peak, tree_rss_mb())
+                finally:
+                    await context.close()
+        finally:
+            display.stop()
+        timings.append(time.perf_counter() - started)
+    return timings, peak
+
+
+async def run_warm(url, tasks, profile_dir, mode):
+    timings, peak = [], 0.0
+    display = WorkerDisplay()
+    if mode == "shared_display":
+        display.start()
+    options = build_launch_options(
+        "headed" if mode == "shared_display" else "headless_new"
+    )
+    try:
+        async with Stealth().use_async(async_playwright()) as p:
+            context = None
+            try:
+                for _ in range(tasks):
+                    started = time.perf_counter()
+                    if context is None:
+                        context = await p.chromium.launch_persistent_context(
+                            user_data_dir=profile_dir, **options
+                        )
+                    await visit(context, url)
+                    peak = max(peak, tree_rss_mb())
+                    timings.append(time.perf_counter() - started)
+            finally:
+                if context:
+                    await context.close()
+    finally:
+        display.stop()
+    return timings, peak
+
+
+async def main(url, tasks, modes):
+    for mode in modes:
+        with tempfile.TemporaryDirectory() as profile_dir:
+            if mode == "display_per_task":
+                timings, peak = await run_cold(url, tasks, profile_dir)
+            else:
+                timings, peak = await run_warm(url, tasks, profile_dir, mode)
+        print(
+            f"{mode:<17} mean={mean(timings):6.2f}s "
+            f"p50={median(timings):6.2f}s max={max(timings):6.2f}s "
+            f"peak_rss={peak:8.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=5)
+    parser.add_argument("--url", default="about:blank")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.tasks, args.modes))
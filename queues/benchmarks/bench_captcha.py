@@ -0,0 +1,141 @@
+"""
+Solve rate and latency of the captcha OCR backends over a labelled corpus.
+
+Holds out part of the corpus, trains the local model on the rest and
+reports exact-match solve rate, latency and how often "auto" mode would
+fall back to the LLM. Pass --llm to also measure the LLM on the holdout.
+Without a collected corpus, --synthetic N renders N look-alike samples.
+
+Usage (from /queues):
+    python -m benchmarks.bench_captcha --corpus captcha/corpus
+    python -m benchmarks.bench_captcha --synthetic 400
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import time
+from statistics import mean
+
+os.environ.setdefault("API_KEY", "bench")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+os.environ.setdefault("IG_USERNAME", "bench")
+os.environ.setdefault("IG_PASSWORD", "bench")
+
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+from scrape.captcha import (  # noqa: E402
+    CaptchaSolver,
+    LocalCaptchaModel,
+    corpus_path,
+    load_corpus,
+)
+
+ALPHABET = "ABCDEFGHJKLMNPRSTUVWXYZ23456789"
+
+
+def synthetic_sample(rng, length=5):
+    text = "".join(rng.choice(ALPHABET) for _ in range(length))
+    image = Image.new("L", (130, 40), 235)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=24)
+    x = 8
+    for char in text:
+        draw.text((x, 6 + rng.randint(-3, 3)), char, fill=30, font=font)
+        x += 20 + rng.randint(0, 4)
+    for _ in range(2):
+        draw.line(
+            [(0, rng.randint(0, 39)), (129, rng.randint(0, 39))],
+            fill=150,
+            width=1,
+        )
+    for _ in range(40):
+        draw.point((rng.randint(0, 129), rng.randint(0, 39)), fill=90)
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue(), text
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+def report(name, results):
+    if not results:
+        print(f"{name:<8} no samples")
+        return
+    solved = sum(1 for ok, _ in results if ok)
+    latencies = [elapsed for _, elapsed in results]
+    print(
+        f"{name:<8} n={len(results)} "
+        f"solve_rate={solved / len(results):6.1%} "
+        f"mean={mean(latencies) * 1000:8.1f}ms "
+        f"p95={percentile(latencies, 0.95) * 1000:8.1f}ms"
+    )
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    if args.synthetic:
+        samples = [synthetic_sample(rng) for _ in range(args.synthetic)]
+    else:
+        samples = load_corpus(args.corpus)
+    if len(samples) < 2:
+        raise SystemExit(f"Not enough labelled samples in {args.corpus}")
+
+    rng.shuffle(samples)
+    cut = max(1, int(len(samples) * args.holdout))
+    holdout, train = samples[:cut], samples[cut:]
+
+    started = time.perf_counter()
+    model = LocalCaptchaModel.train(train)
+    print(
+        f"Trained on {len(train)} samples in "
+        f"{time.perf_counter() - started:.2f}s"
+    )
+
+    local, auto, fallbacks = [], [], 0
+    for data, label in holdout:
+        started = time.perf_counter()
+        text, confidence = model.predict(data)
+        elapsed = time.perf_counter() - started
+        local.append((text == label, elapsed))
+        if confidence >= args.min_confidence:
+            auto.append((text == label, elapsed))
+        else:
+            fallbacks += 1
+
+    report("local", local)
+    report("auto*", auto)
+    print(
+        f"auto falls back to the LLM on {fallbacks / len(holdout):.1%} "
+        "of captchas (* local answers only)"
+    )
+
+    if args.llm:
+        from scrape.supercias import llm
+
+        solver = CaptchaSolver(llm, mode="llm", collect_samples=False)
+        results = []
+        for data, label in holdout[: args.llm]:
+            started = time.perf_counter()
+            answer = await solver.solve(data)
+            elapsed = time.perf_counter() - started
+            results.append((answer.text.upper() == label.upper(), elapsed))
+        report("llm", results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=corpus_path)
+    parser.add_argument("--synthetic", type=int, default=0)
+    parser.add_argument("--holdout", type=float, default=0.3)
+    parser.add_argument("--min-confidence", type=float, default=0.5)
+    parser.add_argument(
+        "--llm", type=int, default=0, help="holdout samples to send to the LLM"
+    )
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
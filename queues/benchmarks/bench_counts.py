@@ -0,0 +1,182 @@
+"""
+Accuracy of the local count and post date parsers over labelled corpora
+and the LLM calls they leave per profile.
+
+Every corpus entry is parsed locally; a None answer is a fallback to the
+LLM and a different number is a mistake. The per-profile figures replay
+a profile of --posts posts with --comments comments each through the
+instagram helpers with a counting stub LLM, against the previous path
+that asked the LLM for the profile counts and every post's likes and
+date.
+
+Usage (from /queues):
+    python -m benchmarks.bench_counts
+    python -m benchmarks.bench_counts --posts 12 --comments 3
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import time
+from collections import Counter
+from datetime import date
+
+os.environ.setdefault("API_KEY", "bench")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+os.environ.setdefault("IG_USERNAME", "bench")
+os.environ.setdefault("IG_PASSWORD", "bench")
+
+from benchmarks.stub_llm import StubLLM  # noqa: E402
+from scrape import instagram  # noqa: E402
+from scrape.counts import parse_counts, parse_likes  # noqa: E402
+from scrape.dates import days_since, parse_post_date  # noqa: E402
+
+FIXTURES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fixtures", "instagram"
+)
+CORPUS = os.path.join(FIXTURES, "counts.json")
+DATES_CORPUS = os.path.join(FIXTURES, "dates.json")
+
+PARSERS = {
+    "profile": parse_counts,
+    "post": parse_likes,
+    "comment": parse_likes,
+    "llm": parse_counts,
+}
+
+
+async def legacy_comment_likes(llm, text):
+    # The comment parsing before the local parser
+    try:
+        if "Responder" not in text:
+            return int(text.split(" ")[0])
+        return 0
+    except Exception:
+        return await instagram.get_number_from_text(llm, text)
+
+
+def accuracy(corpus, rounds):
+    stats = {kind: Counter() for kind in PARSERS}
+    for case in corpus:
+        answer = PARSERS[case["kind"]](case["text"])
+        if answer is None:
+            result = "fallback"
+        elif answer == case["expected"]:
+            result = "correct"
+        else:
+            result = "wrong"
+            print(f"  {case['kind']}: {case['text']!r} -> {answer!r}")
+        stats[case["kind"]][result] += 1
+        if case["expected"] is None and answer is None:
+            stats[case["kind"]]["expected_fallback"] += 1
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for case in corpus:
+            PARSERS[case["kind"]](case["text"])
+    per_parse = (time.perf_counter() - started) / (rounds * len(corpus))
+
+    for kind, counter in stats.items():
+        total = sum(
+            counter[key] for key in ("correct", "fallback", "wrong")
+        )
+        if not total:
+            continue
+        print(
+            f"{kind:<8} cases={total:3d} correct={counter['correct']:3d} "
+            f"fallback={counter['fallback']:2d} "
+            f"(expected {counter['expected_fallback']}) "
+            f"wrong={counter['wrong']:2d}"
+        )
+    print(f"parse latency: {per_parse * 1e6:.1f}us")
+
+
+def date_accuracy(corpus):
+    today = date.fromisoformat(corpus["today"])
+    counter = Counter()
+    for case in corpus["cases"]:
+        answer = days_since(parse_post_date(case["text"], today), today)
+        if answer is None:
+            counter["fallback"] += 1
+        elif answer == case["expected"]:
+            counter["correct"] += 1
+        else:
+            counter["wrong"] += 1
+            print(f"  date: {case['text']!r} -> {answer!r}")
+    print(
+        f"{'date':<8} cases={len(corpus['cases']):3d} "
+        f"correct={counter['correct']:3d} "
+        f"fallback={counter['fallback']:2d} wrong={counter['wrong']:2d}"
+    )
+
+
+async def replay_profiles(texts, profiles, posts, comments, legacy):
+    for _ in range(profiles):
+        text = next(texts["profile"])
+        await instagram.get_number_from_text(legacy, text)
+        await instagram.profile_counts(text)
+        for _ in range(posts):
+            text = next(texts["post"])
+            await instagram.get_likes_from_text(legacy, text)
+            await instagram.post_likes(text)
+            text = next(texts["date"])
+            await instagram.get_days_from_date(legacy, text)
+            if parse_post_date(text) is None:
+                await instagram.get_days_from_date(instagram.llm, text)
+            likes_texts = [next(texts["comment"]) for _ in range(comments)]
+            for text in likes_texts:
+                await legacy_comment_likes(legacy, text)
+            await instagram.comments_likes(likes_texts)
+
+
+def calls_per_profile(corpus, dates, posts, comments):
+    texts = {
+        kind: itertools.cycle(
+            [case["text"] for case in corpus if case["kind"] == kind]
+        )
+        for kind in ("profile", "post", "comment")
+    }
+    # Posts without a datetime attribute, the worst case for the resolver
+    texts["date"] = itertools.cycle(
+        [case["text"] for case in dates["cases"]]
+    )
+    profiles = sum(1 for case in corpus if case["kind"] == "profile")
+
+    legacy, llm = StubLLM(), StubLLM()
+    instagram.llm = llm
+    # Keep the @timed lines of every stubbed call out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(
+            replay_profiles(texts, profiles, posts, comments, legacy)
+        )
+
+    for name, stub in (("llm only", legacy), ("local", llm)):
+        print(
+            f"{name:<8} llm_calls/profile="
+            f"{sum(stub.calls.values()) / profiles:5.2f} "
+            f"by kind={dict(stub.calls)}"
+        )
+
+
+def main(args):
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    with open(args.dates, "r", encoding="utf-8") as f:
+        dates = json.load(f)
+    accuracy(corpus, args.rounds)
+    date_accuracy(dates)
+    calls_per_profile(corpus, dates, args.posts, args.comments)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--dates", default=DATES_CORPUS)
+    parser.add_argument("--posts", type=int, default=12)
+    parser.add_argument("--comments", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,92 @@
+"""
+Per-task overhead of asyncio.run versus a persistent LoopRunner.
+
+Each simulated task opens a page and loads about:blank. With asyncio.run
+every task starts Playwright and launches Chromium; with the runner the
+browser is a loop-bound resource created once.
+
+Usage (from /queues):
+    python -m benchmarks.bench_event_loop --tasks 10
+"""
+
+import argparse
+import asyncio
+import time
+from statistics import mean, median
+
+from playwright.async_api import async_playwright
+
+from loop_runner import LoopRunner
+
+
+async def open_page(browser):
+    page = await browser.new_page()
+    await page.goto("about:blank")
+    await page.close()
+
+
+async def cold_task():
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        try:
+            await open_page(browser)
+        finally:
+            await browser.close()
+
+
+def bench_asyncio_run(tasks):
+    timings = []
+    for _ in range(tasks):
+        started = time.perf_counter()
+        asyncio.run(cold_task())
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def bench_loop_runner(tasks):
+    runner = LoopRunner(name="bench-loop")
+
+    async def start_browser():
+        playwright = await async_playwright().start()
+        browser = await playwright.chromium.launch(headless=True)
+        return playwright, browser
+
+    async def stop_browser(resource):
+        playwright, browser = resource
+        await browser.close()
+        await playwright.stop()
+
+    timings = []
+    try:
+        for _ in range(tasks):
+            started = time.perf_counter()
+            _, browser = runner.resource(
+                "browser", start_browser, stop_browser
+            )
+            runner.run(open_page(browser))
+            timings.append(time.perf_counter() - started)
+    finally:
+        runner.close()
+    return timings
+
+
+def report(name, timings):
+    # The first runner task pays for the launch, the rest show steady state
+    steady = timings[1:] or timings
+    print(
+        f"{name:<14} first={timings[0] * 1000:8.1f}ms "
+        f"steady_mean={mean(steady) * 1000:8.1f}ms "
+        f"steady_p50={median(steady) * 1000:8.1f}ms "
+        f"total={sum(timings):6.2f}s"
+    )
+    return mean(steady)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=10)
+    args = parser.parse_args()
+
+    cold = report("asyncio.run", bench_asyncio_run(args.tasks))
+    warm = report("loop_runner", bench_loop_runner(args.tasks))
+    print(f"Per-task overhead saved: {(cold - warm) * 1000:.1f}ms")
@@ -0,0 +1,143 @@
+"""
+Round trips and wall time to read one Instagram post: the per-element
+handle calls the scraper used to make against the single page.evaluate
+in scrape.instagram.read_post.
+
+Serves benchmarks/fixtures/instagram/post.html with every comment
+rendered, counts each awaited Playwright call as one round trip and
+checks both readers return the same data.
+
+Usage (from /queues):
+    python -m benchmarks.bench_post_extract --comments 10 50 200
+"""
+
+import argparse
+import asyncio
+import inspect
+import os
+import time
+from statistics import median
+
+os.environ.setdefault("API_KEY", "bench")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+os.environ.setdefault("IG_USERNAME", "bench")
+os.environ.setdefault("IG_PASSWORD", "bench")
+
+from playwright.async_api import async_playwright  # noqa: E402
+
+from benchmarks.fixture_server import FixtureServer  # noqa: E402
+from scrape.instagram import read_post  # noqa: E402
+
+LIKES_SELECTOR = (
+    ".html-div.xexx8yu.xyri2b.x18d9i69.x1c1uobl.x9f619.xjbqb8w.x78zum5"
+    + ".x15mokao.x1ga7v0g.x16uus16.xbiv7yw.xr1yuqi"
+)
+
+
+class Counted:
+    """Wraps a page or handle, counting every awaited call on it."""
+
+    def __init__(self, target, counter):
+        self._target = target
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if inspect.isawaitable(result):
+                self._counter[0] += 1
+                result = await result
+            return self._wrap(result)
+
+        return call
+
+    def _wrap(self, result):
+        if isinstance(result, list):
+            return [self._wrap(item) for item in result]
+        if hasattr(result, "query_selector"):
+            return Counted(result, self._counter)
+        return result
+
+
+async def legacy_read_post(page):
+    # The element-by-element reads get_post_info made before read_post
+    sections = await page.query_selector_all("ul._a9z6._a9za > div")
+    description = await sections[0].query_selector("div._a9zr > div")
+    comments_section = await sections[-1].query_selector("> div > div")
+    comments = []
+    for comment in await comments_section.query_selector_all("> div"):
+        container = await comment.query_selector("div._a9zr")
+        body = await container.query_selector("div.xt0psk2 > span")
+        parts = await container.query_selector_all("> div")
+        button = await parts[-1].query_selector("button")
+        comments.append(
+            {
+                "comment": await body.text_content(),
+                "likes_text": await button.text_content(),
+            }
+        )
+    likes = await page.query_selector(LIKES_SELECTOR)
+    time_element = await page.query_selector(
+        "div.x1yztbdb.x1h3rv7z.xf7dkkf time"
+    )
+    return {
+        "description": await description.inner_text(),
+        "comments": comments,
+        "likes_text": await likes.inner_text(),
+        "datetime": await time_element.get_attribute("datetime"),
+        "time_text": await time_element.text_content(),
+    }
+
+
+async def measure(reader, page, rounds):
+    counter, timings, result = [0], [], None
+    counted = Counted(page, counter)
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = await reader(counted)
+        timings.append(time.perf_counter() - started)
+    return counter[0] // rounds, median(timings), result
+
+
+async def main(args):
+    with FixtureServer(latency_ms=0) as server:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            page = await browser.new_page()
+            try:
+                for comments in args.comments:
+                    await page.goto(
+                        f"{server.url}/instagram/p/CBENCH0/"
+                        f"?comments={comments}&per_load={comments}"
+                    )
+                    await page.wait_for_selector("ul._a9z6._a9za > div")
+                    results = {}
+                    for name, reader in (
+                        ("legacy", legacy_read_post),
+                        ("evaluate", read_post),
+                    ):
+                        trips, wall, results[name] = await measure(
+                            reader, page, args.rounds
+                        )
+                        print(
+                            f"comments={comments:<4} {name:<8} "
+                            f"round_trips={trips:5d} "
+                            f"wall={wall * 1000:8.2f}ms"
+                        )
+                    if results["legacy"] != results["evaluate"]:
+                        print("  readers disagree on this post")
+            finally:
+                await browser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--comments", type=int, nargs="+", default=[10, 50, 200]
+    )
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,187 @@
+"""
+Offline throughput benchmark for the Supercias and Instagram scrapers.
+
+Serves the recorded fixtures in benchmarks/fixtures from a local HTTP
+server, points both scrapers at it, swaps the LLM for a stub and reports
+tasks/minute, p50/p95 latency, LLM calls per task and peak RSS.
+
+Usage (from /queues):
+    python -m benchmarks.bench_scrapers --tasks 10 --concurrency 2
+"""
+
+import argparse
+import asyncio
+import glob
+import os
+import shutil
+import tempfile
+import time
+from statistics import median
+
+os.environ.setdefault("API_KEY", "bench")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+os.environ.setdefault("IG_USERNAME", "bench")
+os.environ.setdefault("IG_PASSWORD", "bench")
+
+import psutil  # noqa: E402
+from playwright.async_api import async_playwright  # noqa: E402
+
+from scrape import supercias, instagram  # noqa: E402
+from pdf_store import pdf_store  # noqa: E402
+from benchmarks.fixture_server import FixtureServer  # noqa: E402
+from benchmarks.stub_llm import StubLLM  # noqa: E402
+from llm_gateway import LLMGateway  # noqa: E402
+
+RUC = "0992345678001"
+HANDLES = ["tienda_prueba", "cafe_del_puerto", "ferreteria_norte"]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(q * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def tree_rss_mb():
+    total = 0
+    me = psutil.Process()
+    for proc in [me] + me.children(recursive=True):
+        try:
+            total += proc.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / (1024 * 1024)
+
+
+async def sample_rss(peak, stop):
+    while not stop.is_set():
+        peak[0] = max(peak[0], tree_rss_mb())
+        await asyncio.sleep(0.2)
+
+
+async def run_scraper(name, scrape, browser, jobs, concurrency, llm):
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    latencies, failures = [], 0
+    llm.calls.clear()
+
+    async def worker():
+        nonlocal failures
+        context = await browser.new_context(
+            locale="es-EC", timezone_id="America/Guayaquil"
+        )
+        try:
+            while not queue.empty():
+                args = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    await scrape(context, *args)
+                    latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    failures += 1
+                    print(f"{name} failed: {e}")
+        finally:
+            await context.close()
+
+    peak, stop = [0.0], asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(peak, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    done = len(latencies)
+    print(
+        f"{name:<10} tasks={done} failed={failures} "
+        f"tasks/min={done / elapsed * 60:6.1f} "
+        f"p50={median(latencies) if done else 0:6.2f}s "
+        f"p95={percentile(latencies, 0.95) if done else 0:6.2f}s "
+        f"llm_calls/task={sum(llm.calls.values()) / max(len(jobs), 1):.1f} "
+        f"peak_rss={peak[0]:7.1f}MB"
+    )
+    print(f"{'':<10} llm_calls by kind={dict(llm.calls)}")
+    return latencies
+
+
+async def main(args):
+    llm = StubLLM(latency=args.llm_latency_ms / 1000)
+    gateway = LLMGateway(lambda: llm, concurrency=args.llm_concurrency)
+    supercias.llm = gateway
+    supercias.captcha_solver.llm = gateway
+    supercias.captcha_solver.collect_samples = False
+    instagram.llm = gateway
+    # Every run starts without post snapshots, unless asked to reuse them
+    snapshots_path = tempfile.mkdtemp(prefix="bench-snapshots-")
+    if not args.keep_snapshots:
+        instagram.post_snapshots.folder_path = snapshots_path
+
+    with FixtureServer(latency_ms=args.latency_ms) as server:
+        supercias.base_url = f"{server.url}/supercias/busquedaCompanias.jsf"
+        instagram.IG_BASE_URL = f"{server.url}/instagram"
+
+        supercias_jobs = [
+            (RUC, f"bench-{i}", args.pacing) for i in range(args.tasks)
+        ]
+        instagram_jobs = [
+            (
+                f"{instagram.IG_BASE_URL}/{HANDLES[i % len(HANDLES)]}/",
+                f"bench-{i}",
+                args.pacing,
+                args.post_tabs,
+            )
+            for i in range(args.tasks)
+        ]
+
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            try:
+                if "supercias" in args.scrapers:
+                    await run_scraper(
+                        "supercias",
+                        supercias.scrape_supercias,
+                        browser,
+                        supercias_jobs,
+                        args.concurrency,
+                        llm,
+                    )
+                if "instagram" in args.scrapers:
+                    await run_scraper(
+                        "instagram",
+                        instagram.scrape_instagram,
+                        browser,
+                        instagram_jobs,
+                        args.concurrency,
+                        llm,
+                    )
+            finally:
+                await browser.close()
+
+    for path in glob.glob(os.path.join(supercias.folder_path, "bench-*")):
+        os.remove(path)
+    for i in range(args.tasks):
+        pdf_store.clear("uid", f"bench-{i}")
+    shutil.rmtree(snapshots_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--pacing", choices=["fast", "stealth"], default="fast"
+    )
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--llm-latency-ms", type=float, default=0)
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    # Defaults to the pacing profile's
+    parser.add_argument("--post-tabs", type=int, default=None)
+    parser.add_argument("--keep-snapshots", action="store_true")
+    parser.add_argument(
+        "--scrapers",
+        nargs="+",
+        choices=["supercias", "instagram"],
+        default=["supercias", "instagram"],
+    )
+    asyncio.run(main(parser.parse_args()))
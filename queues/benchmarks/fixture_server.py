@@ -0,0 +1,122 @@
+import os
+import struct
+import threading
+import time
+import zlib
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+fixtures_path = os.path.join(current_dir, "fixtures")
+generated_path = os.path.join(os.path.dirname(current_dir), "generated")
+
+# Recorded statements shipped with the repo, served as the documento PDFs
+STATEMENT_PDFS = {
+    "balance": "demo123-estado.pdf",
+    "flujo": "demo123-flujo.pdf",
+    "integral": "demo123-integral.pdf",
+}
+
+
+def captcha_png(width=120, height=40):
+    # Plain striped image, the stub LLM does not look at it
+    raw = b"".join(
+        b"\x00" + bytes((x * 7 + y * 3) % 256 for x in range(width))
+        for y in range(height)
+    )
+
+    def chunk(kind, data):
+        body = kind + data
+        return (
+            struct.pack(">I", len(data))
+            + body
+            + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+        )
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(
+            b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+        )
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+
+        if parts[:1] == ["supercias"]:
+            return self._supercias(parts[1:], parse_qs(url.query))
+        if parts[:1] == ["instagram"]:
+            return self._instagram(parts[1:])
+        self.send_error(404)
+
+    def _supercias(self, parts, query):
+        name = parts[0] if parts else ""
+        if name.endswith(".jsf"):
+            path = os.path.join(
+                fixtures_path, "supercias", "busquedaCompanias.html"
+            )
+            return self._send_file(path, "text/html; charset=utf-8")
+        if name == "captcha.png":
+            return self._send(captcha_png(), "image/png")
+        if name == "documento":
+            kind = query.get("tipo", ["balance"])[0]
+            return self._send_file(
+                os.path.join(generated_path, STATEMENT_PDFS[kind]),
+                "application/pdf",
+            )
+        self.send_error(404)
+
+    def _instagram(self, parts):
+        if not parts:
+            page = "home.html"
+        elif parts[0] == "p":
+            page = "post.html"
+        else:
+            page = "profile.html"
+        path = os.path.join(fixtures_path, "instagram", page)
+        if not os.path.exists(path):
+            return self.send_error(404)
+        return self._send_file(path, "text/html; charset=utf-8")
+
+    def _send_file(self, path, content_type):
+        with open(path, "rb") as f:
+            self._send(f.read(), content_type)
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FixtureServer:
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0):
+        handler = type(
+            "Handler", (FixtureHandler,), {"latency": latency_ms / 1000}
+        )
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,58 @@
+import threading
+
+from pyvirtualdisplay import Display
+
+BROWSER_MODES = ["headed", "headless_new"]
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit"
+    + "/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36 "
+    + "Edg/139.0.0.0"
+)
+
+
+def build_launch_options(mode="headed", slow_mo=0):
+    if mode not in BROWSER_MODES:
+        raise Exception(f"Unknown browser mode {mode}")
+    options = dict(
+        headless=False,
+        color_scheme="dark",
+        locale="es-EC",
+        no_viewport=True,
+        slow_mo=slow_mo,
+        timezone_id="America/Guayaquil",
+        user_agent=USER_AGENT,
+        args=["--disable-blink-features=AutomationControlled"],
+    )
+    if mode == "headless_new":
+        # The "chromium" channel runs the full browser in new headless
+        # mode instead of the old headless shell, so it keeps the same
+        # fingerprint as headed Chrome and needs no X server.
+        options["headless"] = True
+        options["channel"] = "chromium"
+    return options
+
+
+class WorkerDisplay:
+    """Xvfb display shared by every browser the worker launches."""
+
+    def __init__(self, size=(800, 600)):
+        self.size = size
+        self._display = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if not self._display:
+                self._display = Display(visible=0, size=self.size)
+                self._display.start()
+                print(
+                    "Started virtual display "
+                    + f"{self._display.new_display_var}"
+                )
+
+    def stop(self):
+        with self._lock:
+            if self._display:
+                self._display.stop()
+                self._display = None
@@ -0,0 +1,244 @@
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+import psutil
+from playwright.async_api import async_playwright
+from playwright_stealth import Stealth
+
+from metrics import span
+
+# Pages that outlive the task that opened them, e.g. warm site sessions
+_kept_pages = weakref.WeakSet()
+
+
+def keep_page_open(page):
+    _kept_pages.add(page)
+
+
+class PooledContext:
+    def __init__(self, lease, context):
+        self.profile_path = lease.path
+        self.lease = lease
+        self.context = context
+        self.tasks = 0
+        self.created_at = time.time()
+        self.idle_since = self.created_at
+
+    def rss_mb(self):
+        # Chromium main process carries the --user-data-dir flag, renderers
+        # and helpers hang below it.
+        total = 0
+        for proc in psutil.Process().children(recursive=True):
+            try:
+                if f"--user-data-dir={self.profile_path}" not in " ".join(
+                    proc.cmdline()
+                ):
+                    continue
+                total += proc.memory_info().rss
+                for child in proc.children(recursive=True):
+                    total += child.memory_info().rss
+                break
+            except psutil.Error:
+                continue
+        return total / (1024 * 1024)
+
+
+class BrowserPool:
+    """
+    Long-lived persistent contexts, one per profile, reused across tasks.
+    Every method must run on the same event loop the pool was started on.
+    """
+
+    def __init__(
+        self,
+        launch_options,
+        allocator,
+        size,
+        max_tasks=20,
+        max_rss_mb=1500,
+        health_timeout=5,
+        max_idle_seconds=1800,
+    ):
+        self.launch_options = launch_options
+        self.allocator = allocator
+        self.size = size
+        self.max_tasks = max_tasks
+        self.max_rss_mb = max_rss_mb
+        self.health_timeout = health_timeout
+        self.max_idle_seconds = max_idle_seconds
+
+        self._playwright_cm = None
+        self._playwright = None
+        self._cond = None
+        self._idle = []
+        self._busy = set()
+        self._launching = 0
+        self._counters = {
+            "launches": 0,
+            "reuses": 0,
+            "recycled_max_tasks": 0,
+            "recycled_rss": 0,
+            "recycled_idle": 0,
+            "health_failures": 0,
+            "tasks_served": 0,
+            "wait_seconds_total": 0.0,
+        }
+
+    async def start(self):
+        if self._playwright:
+            return
+        self._cond = asyncio.Condition()
+        self._playwright_cm = Stealth().use_async(async_playwright())
+        self._playwright = await self._playwright_cm.__aenter__()
+
+    async def close(self):
+        for item in self._idle + list(self._busy):
+            await self._close_context(item)
+        self._idle = []
+        self._busy = set()
+        if self._playwright_cm:
+            await self._playwright_cm.__aexit__(None, None, None)
+        self._playwright_cm = None
+        self._playwright = None
+
+    @asynccontextmanager
+    async def lease(self):
+        item = await self._checkout()
+        pages_before = set(item.context.pages)
+        try:
+            yield item.context
+        finally:
+            await self._checkin(item, pages_before)
+
+    def metrics(self):
+        return {
+            **self._counters,
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": len(self._busy),
+            "launching": self._launching,
+            "contexts": [
+                {
+                    "profile": item.profile_path,
+                    "tasks": item.tasks,
+                    "age_seconds": round(time.time() - item.created_at, 1),
+                    "in_use": item in self._busy,
+                }
+                for item in self._idle + list(self._busy)
+            ],
+        }
+
+    async def _checkout(self):
+        started = time.monotonic()
+        while True:
+            async with self._cond:
+                while not self._idle and (
+                    len(self._busy) + self._launching >= self.size
+                ):
+                    await self._cond.wait()
+                if not self._idle:
+                    self._launching += 1
+                    break
+                # Counted as busy while it is checked outside the lock
+                item = self._idle.pop()
+                self._busy.add(item)
+            if await self._is_reusable(item):
+                self._counters["reuses"] += 1
+                self._record_wait(started)
+                return item
+            await self._close_context(item)
+            async with self._cond:
+                self._busy.discard(item)
+                self._cond.notify()
+
+        item = None
+        try:
+            item = await self._launch()
+        finally:
+            async with self._cond:
+                self._launching -= 1
+                if item:
+                    self._busy.add(item)
+                self._cond.notify()
+        self._record_wait(started)
+        return item
+
+    async def _checkin(self, item, pages_before):
+        item.tasks += 1
+        self._counters["tasks_served"] += 1
+        for page in item.context.pages:
+            if page not in pages_before and page not in _kept_pages:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+        # The lease must outlive the idle bound, past which the context is
+        # closed instead of reused
+        item.lease.renew()
+        item.idle_since = time.time()
+        async with self._cond:
+            self._busy.discard(item)
+            self._idle.append(item)
+            stale = [idle for idle in self._idle if self._idle_too_long(idle)]
+            for idle in stale:
+                self._idle.remove(idle)
+            self._cond.notify()
+        for idle in stale:
+            self._counters["recycled_idle"] += 1
+            await self._close_context(idle)
+
+    async def _launch(self):
+        loop = asyncio.get_running_loop()
+        async with span("acquire_profile"):
+            lease = await loop.run_in_executor(None, self.allocator.acquire)
+        try:
+            chromium = self._playwright.chromium
+            async with span("browser_launch"):
+                context = await chromium.launch_persistent_context(
+                    user_data_dir=lease.path, **self.launch_options
+                )
+        except Exception:
+            lease.release()
+            raise
+        self._counters["launches"] += 1
+        print(f"Launched browser context for {lease.path}")
+        return PooledContext(lease, context)
+
+    def _idle_too_long(self, item):
+        return time.time() - item.idle_since > self.max_idle_seconds
+
+    async def _is_reusable(self, item):
+        if item.lease.released:
+            return False
+        if self._idle_too_long(item):
+            self._counters["recycled_idle"] += 1
+            return False
+        if item.tasks >= self.max_tasks:
+            self._counters["recycled_max_tasks"] += 1
+            return False
+        if item.rss_mb() > self.max_rss_mb:
+            self._counters["recycled_rss"] += 1
+            return False
+        try:
+            await asyncio.wait_for(
+                item.context.cookies(), timeout=self.health_timeout
+            )
+        except Exception:
+            self._counters["health_failures"] += 1
+            return False
+        item.lease.renew()
+        return True
+
+    async def _close_context(self, item):
+        try:
+            await item.context.close()
+        except Exception:
+            pass
+        finally:
+            item.lease.release()
+        print(f"Closed browser context for {item.profile_path}")
+
+    def _record_wait(self, started):
+        self._counters["wait_seconds_total"] += time.monotonic() - started
@@ -1,3 +1,4 @@
+from typing import Literal
 from dotenv import find_dotenv
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -10,6 +11,68 @@ class GeneralSettings(BaseSettings):
     IG_USERNAME: str
     IG_PASSWORD: str
 
+    BROWSER_MODE: Literal["headed", "headless_new"] = "headed"
+    SLOW_MO_MS: int = 0
+    PACING_PROFILE: Literal["fast", "stealth"] = "fast"
+
+    REQUEST_FILTER_MODE: Literal["off", "measure", "block"] = "block"
+
+    CAPTCHA_OCR_BACKEND: Literal["auto", "local", "llm"] = "auto"
+    CAPTCHA_MIN_CONFIDENCE: float = 0.5
+    CAPTCHA_COLLECT_SAMPLES: bool = True
+
+    LLM_CONCURRENCY: int = 4
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BACKOFF: float = 1.0
+
+    METRICS_PORT: int = 9808
+
+    # "shared" runs every task of the process on one loop, sharing one
+    # browser pool sized to NUM_PROFILES, so scrapers keep blocking work
+    # off it; "per_thread" gives every Celery thread a loop and a
+    # one-context pool of its own
+    EVENT_LOOP_MODE: Literal["shared", "per_thread"] = "shared"
+
+    NUM_PROFILES: int = 5
+    PROFILE_LEASE_TTL: float = 3600
+    PROFILE_ACQUIRE_TIMEOUT: float = 60
+
+    # "http" replays the documents flow without the browser after the
+    # captcha and falls back to the browser when it cannot
+    SUPERCIAS_CLIENT: Literal["browser", "http"] = "browser"
+    SUPERCIAS_SESSION_MAX_AGE: float = 2 * 3600
+    SUPERCIAS_SESSION_IDLE_TIMEOUT: float = 15 * 60
+    SUPERCIAS_SESSION_MAX_LOOKUPS: int = 50
+
+    SUPERCIAS_CACHE_TTL: float = 30 * 24 * 3600
+    INSTAGRAM_CACHE_TTL: float = 24 * 3600
+    # Ask the LLM for post dates the local parser cannot read
+    INSTAGRAM_DATE_LLM_FALLBACK: bool = True
+    # Tabs reading Instagram posts, 0 follows the pacing profile
+    INSTAGRAM_POST_TABS: int = 0
+    # Known posts re-read on a rescrape: a sample whose odds halve every
+    # half-life of post age, capped per scrape
+    INSTAGRAM_SNAPSHOT_REFRESH_RATE: float = 0.5
+    INSTAGRAM_SNAPSHOT_HALF_LIFE_DAYS: float = 7
+    INSTAGRAM_SNAPSHOT_MAX_REFRESH: int = 3
+    # Per-profile budget, 0 disables a limit
+    INSTAGRAM_MAX_SECONDS: float = 240
+    INSTAGRAM_MAX_POSTS: int = 24
+    INSTAGRAM_MAX_COMMENTS: int = 50
+
+    DISPATCH_CONCURRENCY: int = 2
+    SUPERCIAS_CONCURRENCY: int = 3
+    INSTAGRAM_CONCURRENCY: int = 2
+    PARSE_CONCURRENCY: int = 2
+    SCORE_CONCURRENCY: int = 1
+
+    BROWSER_POOL_MAX_TASKS: int = 20
+    BROWSER_POOL_MAX_RSS_MB: int = 1500
+    BROWSER_POOL_HEALTH_TIMEOUT: float = 5
+    # Kept below PROFILE_LEASE_TTL so an idle context never outlives its
+    # lease
+    BROWSER_POOL_MAX_IDLE_SECONDS: float = 1800
+
     model_config = SettingsConfigDict(
         env_file=find_dotenv(filename=".env", usecwd=True),
         env_file_encoding="utf-8",
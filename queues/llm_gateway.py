@@ -0,0 +1,72 @@
+import asyncio
+import weakref
+
+from langchain_openai import ChatOpenAI
+
+from config import general_settings
+from metrics import LLM_RETRIES
+
+
+class LLMGateway:
+    """
+    Async front for the chat model shared by the scrapers. Calls go
+    through ainvoke so they never block the event loop, at most
+    `concurrency` are in flight per loop and failed calls are retried
+    with exponential backoff before the last error is raised. Each loop
+    gets its own model from `llm_factory`.
+    """
+
+    def __init__(self, llm_factory, concurrency=4, retries=2, backoff=1.0):
+        self.llm_factory = llm_factory
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        # The semaphore and the model's async HTTP client belong to one
+        # loop, and per_thread mode runs one loop per worker thread
+        self._per_loop = weakref.WeakKeyDictionary()
+
+    async def ainvoke(self, messages):
+        semaphore, model = self._for_loop()
+        for attempt in range(self.retries + 1):
+            try:
+                async with semaphore:
+                    return await model.ainvoke(messages)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                LLM_RETRIES.inc()
+                delay = self.backoff * 2**attempt
+                print(f"LLM call failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def abatch(self, inputs):
+        # One ainvoke per prompt so the batch shares the concurrency bound
+        return await asyncio.gather(
+            *[self.ainvoke(messages) for messages in inputs]
+        )
+
+    def _for_loop(self):
+        loop = asyncio.get_running_loop()
+        entry = self._per_loop.get(loop)
+        if entry is None:
+            entry = (asyncio.Semaphore(self.concurrency), self.llm_factory())
+            self._per_loop[loop] = entry
+        return entry
+
+
+def chat_model():
+    return ChatOpenAI(
+        model="gpt-4.1",
+        openai_api_key=general_settings.API_KEY,
+        temperature=0.2,
+        # The gateway owns the retries
+        max_retries=0,
+    )
+
+
+llm = LLMGateway(
+    chat_model,
+    concurrency=general_settings.LLM_CONCURRENCY,
+    retries=general_settings.LLM_MAX_RETRIES,
+    backoff=general_settings.LLM_RETRY_BACKOFF,
+)
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+
+
+class LoopRunner:
+    """
+    Event loop kept running in its own thread. Callers submit coroutines
+    to it, so loop-bound resources (browsers, HTTP and LLM clients) can
+    live across tasks instead of dying with an asyncio.run loop.
+    """
+
+    def __init__(self, name="loop-runner"):
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self._resources = {}
+        self._resource_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name=name, daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+    def resource(self, name, factory, closer=None):
+        # factory and closer are coroutine functions executed on this loop
+        with self._resource_lock:
+            if name not in self._resources:
+                self._resources[name] = (self.run(factory()), closer)
+            return self._resources[name][0]
+
+    def get_resource(self, name):
+        with self._resource_lock:
+            value = self._resources.get(name)
+        return value[0] if value else None
+
+    def close(self):
+        with self._resource_lock:
+            resources = list(self._resources.items())
+            self._resources = {}
+        for name, (value, closer) in reversed(resources):
+            if not closer:
+                continue
+            try:
+                self.run(closer(value))
+            except Exception as e:
+                print(f"Error closing {name} on {self.name}: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=10)
+        self.loop.close()
+
+
+_registry_lock = threading.Lock()
+_thread_local = threading.local()
+_shared_runner = None
+_runners = []
+
+
+def get_shared_runner():
+    global _shared_runner
+    with _registry_lock:
+        if _shared_runner is None:
+            _shared_runner = LoopRunner(name="shared-loop")
+            _runners.append(_shared_runner)
+        return _shared_runner
+
+
+def get_thread_runner():
+    runner = getattr(_thread_local, "runner", None)
+    if runner is None:
+        runner = LoopRunner(name=f"{threading.current_thread().name}-loop")
+        _thread_local.runner = runner
+        with _registry_lock:
+            _runners.append(runner)
+    return runner
+
+
+def list_runners():
+    with _registry_lock:
+        return list(_runners)
+
+
+def close_runners():
+    global _shared_runner
+    with _registry_lock:
+        runners = list(_runners)
+        _runners.clear()
+        _shared_runner = None
+    for runner in runners:
+        runner.close()
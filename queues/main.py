@@ -1,23 +1,49 @@
-import os
 import asyncio
-from celery import Celery
-from pyvirtualdisplay import Display
-from playwright.async_api import async_playwright
-from playwright_stealth import Stealth
+import os
+import sys
+from celery import Celery, chain, chord
+from celery.signals import worker_init, worker_shutdown
 from config import general_settings
+from browser_pool import BrowserPool
+from browser_launch import build_launch_options, WorkerDisplay
+from profiles import ProfileAllocator
+from scrape_cache import ScrapeCache
+from pdf_store import pdf_store
+from metrics import span, financial_info_id_var, start_metrics_server
+from loop_runner import (
+    get_shared_runner,
+    get_thread_runner,
+    list_runners,
+    close_runners,
+)
 from scrape import scrape_supercias_wrapper, scrape_instagram_wrapper
+from scrape.supercias import scrape_supercias, supercias_sessions
 from databases.postgres import DatabaseSession, FinancialInfo
-from filelock import FileLock, Timeout
-# from ai_agent import analyze_company, SCORING_WEIGHTS
+from ai_agent import parse_statements, score_company
 
 REDIS_URL = general_settings.REDIS_URL
 IN_DOCKER = general_settings.IN_DOCKER
+EVENT_LOOP_MODE = general_settings.EVENT_LOOP_MODE
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 folder_path = os.path.join(current_dir, "profiles_pool")
 
-NUM_PROFILES = 5
-LOCK_TIMEOUT = 5
+NUM_PROFILES = general_settings.NUM_PROFILES
+
+scrape_cache = ScrapeCache(
+    os.path.join(current_dir, "scrape_cache"),
+    os.path.join(current_dir, "generated"),
+    supercias_ttl=general_settings.SUPERCIAS_CACHE_TTL,
+    ig_ttl=general_settings.INSTAGRAM_CACHE_TTL,
+    pdf_store=pdf_store,
+)
+
+profile_allocator = ProfileAllocator(
+    folder_path,
+    NUM_PROFILES,
+    lease_ttl=general_settings.PROFILE_LEASE_TTL,
+    acquire_timeout=general_settings.PROFILE_ACQUIRE_TIMEOUT,
+)
 
 
 celery_app = Celery(
@@ -35,91 +61,116 @@ celery_app.conf.update(
     worker_concurrency=5,
     broker_connection_retry_on_startup=True,
     worker_prefetch_multiplier=1,
+    task_routes={
+        "scrape_supercias": {"queue": "supercias"},
+        "scrape_batch": {"queue": "supercias"},
+        "scrape_instagram": {"queue": "instagram"},
+        "parse_statements": {"queue": "parse"},
+        "score_company": {"queue": "score"},
+        "mark_failed": {"queue": "celery"},
+        # Pools, sessions and profiles live in the browser stages; these
+        # read the Supercias worker, pass queue="instagram" to
+        # apply_async for the Instagram one
+        "browser_pool_metrics": {"queue": "supercias"},
+        "supercias_session_metrics": {"queue": "supercias"},
+        "profile_metrics": {"queue": "supercias"},
+    },
 )
 
+# Browser stages hold a profile each, so they run on threads sharing the
+# worker's browser pool; PDF parsing is CPU-bound and gets processes.
+STAGES = {
+    "dispatch": dict(
+        queue="celery",
+        pool="threads",
+        concurrency=general_settings.DISPATCH_CONCURRENCY,
+    ),
+    "supercias": dict(
+        queue="supercias",
+        pool="threads",
+        concurrency=general_settings.SUPERCIAS_CONCURRENCY,
+    ),
+    "instagram": dict(
+        queue="instagram",
+        pool="threads",
+        concurrency=general_settings.INSTAGRAM_CONCURRENCY,
+    ),
+    "parse": dict(
+        queue="parse",
+        pool="prefork",
+        concurrency=general_settings.PARSE_CONCURRENCY,
+    ),
+    "score": dict(
+        queue="score",
+        pool="prefork",
+        concurrency=general_settings.SCORE_CONCURRENCY,
+    ),
+}
 
-def acquire_profile():
-    for i in range(1, NUM_PROFILES + 1):
-        profile_path = os.path.join(folder_path, f"profile_{i}")
-        lock_path = profile_path + ".lock"
-        os.makedirs(profile_path, exist_ok=True)
-        lock = FileLock(lock_path)
-        try:
-            lock.acquire(timeout=LOCK_TIMEOUT)
-            print(f"Acquired profile {i} by {os.getpid()}")
-            return profile_path, lock
-        except Timeout:
-            continue
-    raise Exception(
-        f"No profile available after {LOCK_TIMEOUT} seconds. "
-        + "Please, try again later."
-    )
 
+LAUNCH_OPTIONS = build_launch_options(
+    general_settings.BROWSER_MODE, general_settings.SLOW_MO_MS
+)
 
-def release_profile(lock):
-    lock.release()
-    print(f"Released profile by {os.getpid()}")
+worker_display = WorkerDisplay()
 
 
-async def _run_scraping(browser, ruc, ig_url, uid):
-    return await asyncio.gather(
-        scrape_supercias_wrapper(browser, ruc, uid),
-        scrape_instagram_wrapper(browser, ig_url, uid),
-    )
+def get_runner():
+    # Browsers are bound to the loop that launched them, so the pool lives
+    # on the runner it was created on: one for the whole process in
+    # "shared" mode, one per Celery thread in "per_thread" mode.
+    if EVENT_LOOP_MODE == "per_thread":
+        return get_thread_runner()
+    return get_shared_runner()
 
 
-async def get_company_info(ruc, ig_url, uid):
-    profile_path, lock = acquire_profile()
-    try:
-        launch_options = dict(
-            headless=False,
-            user_data_dir=profile_path,
-            color_scheme="dark",
-            locale="es-EC",
-            no_viewport=True,
-            slow_mo=2000,
-            timezone_id="America/Guayaquil",
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit"
-            + "/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36 "
-            + "Edg/139.0.0.0",
-            args=["--disable-blink-features=AutomationControlled"],
+def get_browser_pool(runner):
+    async def start_pool():
+        pool = BrowserPool(
+            LAUNCH_OPTIONS,
+            profile_allocator,
+            size=NUM_PROFILES if EVENT_LOOP_MODE == "shared" else 1,
+            max_tasks=general_settings.BROWSER_POOL_MAX_TASKS,
+            max_rss_mb=general_settings.BROWSER_POOL_MAX_RSS_MB,
+            health_timeout=general_settings.BROWSER_POOL_HEALTH_TIMEOUT,
+            max_idle_seconds=general_settings.BROWSER_POOL_MAX_IDLE_SECONDS,
         )
+        await pool.start()
+        return pool
 
-        if IN_DOCKER:
-            with Display(visible=0, size=(800, 600)):
-                async with Stealth().use_async(async_playwright()) as p:
-                    browser = await p.chromium.launch_persistent_context(
-                        **launch_options
-                    )
-                    try:
-                        results = await _run_scraping(
-                            browser, ruc, ig_url, uid
-                        )
-                    finally:
-                        await browser.close()
-                    return results
-        else:
-            async with Stealth().use_async(async_playwright()) as p:
-                browser = await p.chromium.launch_persistent_context(
-                    **launch_options
-                )
-                try:
-                    results = await _run_scraping(browser, ruc, ig_url, uid)
-                finally:
-                    await browser.close()
-                return results
-    finally:
-        release_profile(lock)
+    async def close_pool(pool):
+        await pool.close()
 
+    if IN_DOCKER and general_settings.BROWSER_MODE == "headed":
+        worker_display.start()
+    return runner.resource("browser_pool", start_pool, close_pool)
 
-def sync_wrapper(ruc, ig_url, uid):
-    return asyncio.run(get_company_info(ruc, ig_url, uid))
 
+@worker_init.connect
+def start_worker_metrics(**kwargs):
+    start_metrics_server(general_settings.METRICS_PORT)
 
-@celery_app.task(name="scrape_task")
-def scrape_task(financial_info_id, ruc, ig_url):
-    uid = financial_info_id
-    print("Task started", financial_info_id, ruc, ig_url, uid)
+
+@worker_shutdown.connect
+def close_worker_loops(**kwargs):
+    close_runners()
+    worker_display.stop()
+
+
+def run_with_browser(financial_info_id, scraper, *args):
+    runner = get_runner()
+    pool = get_browser_pool(runner)
+
+    async def run():
+        # Runs on the loop thread, which does not see the task's context
+        financial_info_id_var.set(financial_info_id)
+        async with pool.lease() as browser:
+            return await scraper(browser, *args)
+
+    return runner.run(run())
+
+
+def set_status(financial_info_id, status):
     with DatabaseSession() as db:
         financial_info = (
             db.query(FinancialInfo)
@@ -128,25 +179,279 @@ def scrape_task(financial_info_id, ruc, ig_url):
         )
         if not financial_info:
             raise Exception("Financial info not found")
-        financial_info.status = "IN_PROGRESS"
+        financial_info.status = status
         db.commit()
-        db.refresh(financial_info)
-    sync_wrapper(ruc, ig_url, uid)
+
+
+def dispatch_pipeline(
+    uid, ruc, ig_url, force_refresh, pacing, supercias_files=None
+):
+    # supercias_files is set when a batch already scraped the statements
+    supercias_hit = None
+    if supercias_files is None and not force_refresh:
+        supercias_hit = scrape_cache.get_supercias(ruc)
+    ig_hit = None if force_refresh else scrape_cache.get_instagram(ig_url)
+    statements = None
+    header = []
+
+    # An entry whose files are gone is a miss, scraped again
+    if supercias_hit:
+        try:
+            scrape_cache.restore_supercias(ruc, uid)
+        except OSError as e:
+            print("Supercias cache entry unusable", ruc, e)
+            supercias_hit = None
+    if ig_hit:
+        try:
+            scrape_cache.restore_instagram(ig_url, uid)
+        except OSError as e:
+            print("Instagram cache entry unusable", ig_url, e)
+            ig_hit = None
+
+    if supercias_files is not None:
+        header.append(parse_statements_task.si(supercias_files, uid, ruc))
+    elif supercias_hit:
+        print("Supercias cache hit", ruc)
+        statements = supercias_hit.get("statements")
+        if statements is None:
+            header.append(parse_statements_task.si(None, uid, ruc))
+    else:
+        header.append(
+            chain(
+                scrape_supercias_task.si(uid, ruc, pacing),
+                parse_statements_task.s(uid, ruc),
+            )
+        )
+
+    if ig_hit:
+        print("Instagram cache hit", ig_url)
+    else:
+        header.append(scrape_instagram_task.si(uid, ig_url, pacing))
+
+    if not header:
+        return score_company_task([], uid, statements)
+
+    # A failed stage fails the chord, which then calls the body's errback
+    body = score_company_task.s(uid, statements).on_error(
+        mark_failed_task.si(uid)
+    )
+    with span("dispatch_pipeline"):
+        chord(header, body).apply_async()
+    return "Task enqueued"
+
+
+@celery_app.task(name="scrape_task")
+def scrape_task(
+    financial_info_id, ruc, ig_url, force_refresh=False, pacing=None
+):
+    uid = financial_info_id
+    pacing = pacing or general_settings.PACING_PROFILE
+    financial_info_id_var.set(financial_info_id)
+    print("Task started", financial_info_id, ruc, ig_url, uid)
+    set_status(financial_info_id, "IN_PROGRESS")
+    return dispatch_pipeline(uid, ruc, ig_url, force_refresh, pacing)
+
+
+@celery_app.task(name="scrape_batch")
+def scrape_batch_task(items, force_refresh=False, pacing=None):
+    """
+    items are [financial_info_id, ruc, ig_url] lists. Every Supercias
+    lookup runs in one browser lease and so in one Supercias session; the
+    rest of each company's pipeline is dispatched as its statements land.
+    """
+    pacing = pacing or general_settings.PACING_PROFILE
+    summary = {"scraped": 0, "cached": 0, "failed": 0, "missing": 0}
+    pending = {}
+    for financial_info_id, ruc, ig_url in items:
+        try:
+            set_status(financial_info_id, "IN_PROGRESS")
+        except Exception as e:
+            print("Batch item skipped", financial_info_id, e)
+            summary["missing"] += 1
+            continue
+        if not force_refresh and scrape_cache.get_supercias(ruc):
+            dispatch_pipeline(financial_info_id, ruc, ig_url, False, pacing)
+            summary["cached"] += 1
+            continue
+        pending[financial_info_id] = (ruc, ig_url)
+
+    handled = set()
+
+    def on_item(financial_info_id, files):
+        handled.add(financial_info_id)
+        ruc, ig_url = pending[financial_info_id]
+        if files is None:
+            set_status(financial_info_id, "FAILED")
+            summary["failed"] += 1
+            return
+        scrape_cache.put_supercias(ruc, financial_info_id, files)
+        dispatch_pipeline(
+            financial_info_id,
+            ruc,
+            ig_url,
+            force_refresh,
+            pacing,
+            supercias_files=files,
+        )
+        summary["scraped"] += 1
+
+    runner = get_runner()
+    pool = get_browser_pool(runner)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        async with pool.lease() as browser:
+            for financial_info_id, (ruc, _) in pending.items():
+                financial_info_id_var.set(financial_info_id)
+                try:
+                    async with span("scrape_supercias"):
+                        files = await scrape_supercias(
+                            browser, ruc, financial_info_id, pacing
+                        )
+                except Exception as e:
+                    print("Batch item failed", financial_info_id, e)
+                    files = None
+                # Database and broker calls stay off the browser loop
+                try:
+                    await loop.run_in_executor(
+                        None, on_item, financial_info_id, files
+                    )
+                except Exception as e:
+                    print("Batch item not dispatched", financial_info_id, e)
+
+    if pending:
+        try:
+            with span("scrape_batch"):
+                runner.run(run())
+        except Exception:
+            # No lease or a broken shared session: items not handed on
+            # yet would otherwise stay IN_PROGRESS
+            for financial_info_id in pending:
+                if financial_info_id in handled:
+                    continue
+                try:
+                    set_status(financial_info_id, "FAILED")
+                except Exception as e:
+                    print("Batch item not marked", financial_info_id, e)
+            raise
+    print("Batch finished", summary)
+    return summary
+
+
+@celery_app.task(name="scrape_supercias")
+def scrape_supercias_task(financial_info_id, ruc, pacing="fast"):
+    financial_info_id_var.set(financial_info_id)
+    with span("scrape_supercias"):
+        files = run_with_browser(
+            financial_info_id,
+            scrape_supercias_wrapper,
+            ruc,
+            financial_info_id,
+            pacing,
+        )
+    scrape_cache.put_supercias(ruc, financial_info_id, files)
+    return files
+
+
+@celery_app.task(name="scrape_instagram")
+def scrape_instagram_task(financial_info_id, ig_url, pacing="fast"):
+    financial_info_id_var.set(financial_info_id)
+    with span("scrape_instagram"):
+        social = run_with_browser(
+            financial_info_id,
+            scrape_instagram_wrapper,
+            ig_url,
+            financial_info_id,
+            pacing,
+        )
+    scrape_cache.put_instagram(ig_url, financial_info_id, social)
+    return {"posts": len(social.get("posts", []))}
+
+
+@celery_app.task(name="parse_statements")
+def parse_statements_task(files, financial_info_id, ruc):
+    financial_info_id_var.set(financial_info_id)
+    print("Parsing statements", financial_info_id, files)
+    # Identical PDFs parse to identical values, whoever downloaded them
+    key = pdf_store.statements_key(pdf_store.refs("uid", financial_info_id))
+    statements = pdf_store.get_parsed(key)
+    if statements is None:
+        with span("parse_statements"):
+            statements = parse_statements(financial_info_id)
+        pdf_store.put_parsed(key, statements)
+    scrape_cache.put_statements(ruc, statements)
+    return {"statements": statements}
+
+
+@celery_app.task(name="score_company")
+def score_company_task(results, financial_info_id, statements=None):
+    for result in results:
+        if statements is None and "statements" in result:
+            statements = result["statements"]
+    financial_info_id_var.set(financial_info_id)
+    print("Scoring company", financial_info_id, results)
+    with span("score_company"):
+        analysis = score_company(financial_info_id, statements or {})
     with DatabaseSession() as db:
-        # analysis = analyze_company(uid)
         financial_info = (
             db.query(FinancialInfo)
             .filter(FinancialInfo.id == financial_info_id)
             .first()
         )
         financial_info.status = "COMPLETED"
-        # for key in SCORING_WEIGHTS.keys():
-        #     financial_info.setattr(key, analysis.get(key, 0))
+        for item in analysis["scoring_breakdown"]:
+            setattr(financial_info, item["factor"], item["score"])
         db.commit()
         db.refresh(financial_info)
-    return "Task completed"
+    return {
+        "risk_score": analysis["risk_score"],
+        "risk_band": analysis["risk_band"],
+    }
+
+
+@celery_app.task(name="mark_failed")
+def mark_failed_task(financial_info_id):
+    print("Pipeline failed", financial_info_id)
+    set_status(financial_info_id, "FAILED")
+
+
+@celery_app.task(name="browser_pool_metrics")
+def browser_pool_metrics():
+    metrics = {}
+    for runner in list_runners():
+        pool = runner.get_resource("browser_pool")
+        if pool:
+            metrics[runner.name] = pool.metrics()
+    return metrics
+
+
+@celery_app.task(name="supercias_session_metrics")
+def supercias_session_metrics():
+    return supercias_sessions.stats()
+
+
+@celery_app.task(name="profile_metrics")
+def profile_metrics():
+    return profile_allocator.stats()
 
 
 if __name__ == "__main__":
-    args = ["worker", "--loglevel=info"]
+    # python main.py [stage ...] starts a worker for the given stages,
+    # all of them by default.
+    stages = sys.argv[1:] or list(STAGES)
+    queues = [STAGES[stage]["queue"] for stage in stages]
+    concurrency = sum(STAGES[stage]["concurrency"] for stage in stages)
+    pool = (
+        "prefork"
+        if all(STAGES[stage]["pool"] == "prefork" for stage in stages)
+        else "threads"
+    )
+    args = [
+        "worker",
+        "--loglevel=info",
+        f"--queues={','.join(queues)}",
+        f"--concurrency={concurrency}",
+        f"--pool={pool}",
+        f"--hostname={'-'.join(stages)}@%h",
+    ]
     celery_app.worker_main(argv=args)
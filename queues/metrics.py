@@ -0,0 +1,130 @@
+import functools
+import inspect
+import os
+import time
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    multiprocess,
+    start_http_server,
+)
+
+STAGE_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600]
+
+STAGE_DURATION = Histogram(
+    "scrape_stage_duration_seconds",
+    "Duration of each scrape pipeline stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_FAILURES = Counter(
+    "scrape_stage_failures_total",
+    "Scrape pipeline stages that raised",
+    ["stage"],
+)
+BYTES_DOWNLOADED = Counter(
+    "scrape_bytes_downloaded_total",
+    "Bytes downloaded by the scrapers",
+    ["source"],
+)
+CAPTCHA_SOLVES = Counter(
+    "scrape_captcha_solves_total",
+    "Captcha answers submitted, by OCR backend",
+    ["backend"],
+)
+LLM_RETRIES = Counter(
+    "scrape_llm_retries_total",
+    "LLM calls retried by the gateway",
+)
+
+# Per-company ids would explode label cardinality, so they are attached
+# as exemplars and printed with every span instead.
+financial_info_id_var = ContextVar("financial_info_id", default=None)
+
+
+def _exemplar():
+    financial_info_id = financial_info_id_var.get()
+    if financial_info_id is None:
+        return None
+    return {"financial_info_id": str(financial_info_id)}
+
+
+class span:
+    """Times a stage, usable as a sync or async context manager."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time.perf_counter() - self.started
+        STAGE_DURATION.labels(self.stage).observe(
+            duration, exemplar=_exemplar()
+        )
+        if exc_type is not None:
+            STAGE_FAILURES.labels(self.stage).inc(exemplar=_exemplar())
+        status = "failed" if exc_type else "ok"
+        print(
+            f"[{financial_info_id_var.get()}] {self.stage} {status} "
+            + f"in {duration:.2f}s"
+        )
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return self.__exit__(exc_type, exc_val, exc_tb)
+
+
+def timed(stage):
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count_bytes(source, amount):
+    if amount:
+        BYTES_DOWNLOADED.labels(source).inc(amount, exemplar=_exemplar())
+
+
+def start_metrics_server(port):
+    if not port:
+        return
+    registry = None
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # prefork stages write to the shared directory, aggregate it here
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    try:
+        if registry:
+            start_http_server(port, registry=registry)
+        else:
+            start_http_server(port)
+    except OSError as e:
+        # Several stage workers on one host need distinct METRICS_PORTs
+        print(f"Could not start metrics server on :{port}: {e}")
+        return
+    print(f"Metrics available on :{port}/metrics")
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+
+from filelock import FileLock
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def _write_chunk(f, digest, chunk):
+    digest.update(chunk)
+    f.write(chunk)
+
+
+def _remove_if_exists(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class PdfStore:
+    """
+    Statement PDFs stored once per SHA-256 under blobs/, plus small JSON
+    indexes mapping each uid and RUC to the hash and size of every
+    statement kind. The scrapers and the parser keep working with
+    generated/{uid}-{kind}.pdf, which is a hardlink into the store.
+    Besides put_stream every method is blocking file I/O, which async
+    callers run with asyncio.to_thread.
+    """
+
+    def __init__(self, folder_path, generated_path):
+        self.folder_path = folder_path
+        self.generated_path = generated_path
+        # Statements of one uid are recorded concurrently, and the index
+        # files are shared with other worker processes
+        self._index_lock = threading.Lock()
+
+    async def put_stream(self, chunks):
+        """Write an async iterator of bytes, return its hash and size."""
+        # Hashing and disk writes run in worker threads so the event loop
+        # keeps serving the other scrapes
+        tmp_path = await asyncio.to_thread(self._tmp_path)
+        digest, size = hashlib.sha256(), 0
+        try:
+            f = await asyncio.to_thread(open, tmp_path, "wb")
+            try:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    await asyncio.to_thread(_write_chunk, f, digest, chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+            sha256 = digest.hexdigest()
+            await asyncio.to_thread(self._store_blob, tmp_path, sha256)
+        except BaseException:
+            await asyncio.to_thread(_remove_if_exists, tmp_path)
+            raise
+        return {"sha256": sha256, "size": size}
+
+    def _tmp_path(self):
+        tmp_dir = os.path.join(self.folder_path, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        return os.path.join(tmp_dir, uuid.uuid4().hex)
+
+    def _store_blob(self, tmp_path, sha256):
+        blob_path = self.blob_path(sha256)
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(tmp_path, blob_path)
+
+    def blob_path(self, sha256):
+        return os.path.join(
+            self.folder_path, "blobs", sha256[:2], f"{sha256}.pdf"
+        )
+
+    def has(self, sha256):
+        return os.path.exists(self.blob_path(sha256))
+
+    def link(self, sha256, uid, kind):
+        """Expose a stored blob as generated/{uid}-{kind}.pdf."""
+        os.makedirs(self.generated_path, exist_ok=True)
+        target = os.path.join(self.generated_path, f"{uid}-{kind}.pdf")
+        if os.path.lexists(target):
+            os.remove(target)
+        try:
+            os.link(self.blob_path(sha256), target)
+        except OSError:
+            # Different filesystem (e.g. a mounted generated/ volume)
+            shutil.copyfile(self.blob_path(sha256), target)
+        return target
+
+    def record(self, uid, ruc, kind, blob):
+        ref = {"sha256": blob["sha256"], "size": blob["size"]}
+        for index, key in (("uid", uid), ("ruc", ruc)):
+            if key is None:
+                continue
+            path = self._index_path(index, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._index_lock, FileLock(path + ".lock"):
+                refs = self.refs(index, key)
+                refs[kind] = ref
+                self._write_index(index, key, refs)
+
+    def refs(self, index, key):
+        try:
+            with open(
+                self._index_path(index, key), "r", encoding="utf-8"
+            ) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def clear(self, index, key):
+        try:
+            os.remove(self._index_path(index, key))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def statements_key(refs):
+        """Cache key for anything derived from this set of statements."""
+        if not refs:
+            return None
+        joined = ",".join(
+            f"{kind}:{refs[kind]['sha256']}" for kind in sorted(refs)
+        )
+        return hashlib.sha256(joined.encode()).hexdigest()
+
+    def get_parsed(self, key):
+        if not key:
+            return None
+        try:
+            with open(self._parsed_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put_parsed(self, key, statements):
+        if key:
+            self._write_json(self._parsed_path(key), statements)
+
+    def _parsed_path(self, key):
+        return os.path.join(self.folder_path, "parsed", f"{key}.json")
+
+    def _index_path(self, index, key):
+        safe_key = re.sub(r"[^0-9A-Za-z._-]", "_", str(key))
+        return os.path.join(self.folder_path, index, f"{safe_key}.json")
+
+    def _write_index(self, index, key, refs):
+        self._write_json(self._index_path(index, key), refs)
+
+    def _write_json(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+pdf_store = PdfStore(
+    os.path.join(current_dir, "pdf_store"),
+    os.path.join(current_dir, "generated"),
+)
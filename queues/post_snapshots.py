@@ -0,0 +1,153 @@
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+from datetime import date, timedelta
+
+from filelock import FileLock
+
+
+class PostSnapshotStore:
+    """
+    Last known state of every post of an Instagram profile, keyed by
+    shortcode. A rescrape only opens the posts it has never seen plus a
+    sample of known ones, more likely the younger the post is, and
+    merges the rest from the snapshot.
+    """
+
+    def __init__(
+        self,
+        folder_path,
+        refresh_rate=0.5,
+        half_life_days=7,
+        max_refresh=3,
+        rng=None,
+    ):
+        self.folder_path = folder_path
+        self.refresh_rate = refresh_rate
+        self.half_life_days = half_life_days
+        self.max_refresh = max_refresh
+        self.rng = rng or random.Random()
+
+    def load(self, handle):
+        try:
+            with open(self._path(handle), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"profile": {}, "posts": {}}
+
+    def plan(self, handle, shortcodes):
+        """Which of the grid's posts to open: new ones plus a sample."""
+        known = self.load(handle)["posts"]
+        new = [code for code in shortcodes if code not in known]
+        candidates = []
+        for code in shortcodes:
+            if code in known and self._should_refresh(known[code]):
+                candidates.append(code)
+        return new + candidates[: self.max_refresh]
+
+    def update(self, handle, profile, shortcodes, fetched):
+        """
+        Store freshly fetched posts and return the delta against the
+        previous snapshot and the merged posts in grid order.
+        """
+        # Concurrent scrapes of the same handle would otherwise drop each
+        # other's posts between the read and the write
+        os.makedirs(self.folder_path, exist_ok=True)
+        with FileLock(self._path(handle) + ".lock"):
+            return self._update(handle, profile, shortcodes, fetched)
+
+    def _update(self, handle, profile, shortcodes, fetched):
+        snapshot = self.load(handle)
+        known = snapshot["posts"]
+        now = time.time()
+        today = date.today()
+        delta = {"new": [], "refreshed": [], "changed": {}, "profile": {}}
+
+        for field, value in profile.items():
+            if snapshot["profile"].get(field) != value:
+                delta["profile"][field] = [
+                    snapshot["profile"].get(field),
+                    value,
+                ]
+
+        for code, info in fetched.items():
+            entry = {
+                "description": info["description"],
+                "likes": info["likes"],
+                "comments": info["comments"],
+                "posted_on": (
+                    (today - timedelta(days=info["last_day"])).isoformat()
+                    if isinstance(info.get("last_day"), int)
+                    else None
+                ),
+                "fetched_at": now,
+            }
+            previous = known.get(code)
+            if previous is None:
+                delta["new"].append(code)
+            else:
+                delta["refreshed"].append(code)
+                changes = {
+                    field: [previous.get(field), entry[field]]
+                    for field in ("likes", "description")
+                    if previous.get(field) != entry[field]
+                }
+                if len(previous["comments"]) != len(entry["comments"]):
+                    changes["comments"] = [
+                        len(previous["comments"]),
+                        len(entry["comments"]),
+                    ]
+                if changes:
+                    delta["changed"][code] = changes
+            known[code] = entry
+
+        posts = [
+            self._as_post(code, known[code], today)
+            for code in shortcodes
+            if code in known
+        ]
+        self._write(
+            handle, {"profile": profile, "posts": known, "updated_at": now}
+        )
+        return delta, posts
+
+    def _should_refresh(self, entry):
+        posted_on = entry.get("posted_on")
+        if posted_on is None:
+            return True
+        age = (date.today() - date.fromisoformat(posted_on)).days
+        chance = self.refresh_rate * math.pow(
+            0.5, max(age, 0) / self.half_life_days
+        )
+        return self.rng.random() < chance
+
+    @staticmethod
+    def _as_post(code, entry, today):
+        posted_on = entry.get("posted_on")
+        return {
+            "shortcode": code,
+            "description": entry["description"],
+            "likes": entry["likes"],
+            "last_day": (
+                (today - date.fromisoformat(posted_on)).days
+                if posted_on
+                else None
+            ),
+            "comments": entry["comments"],
+        }
+
+    def _path(self, handle):
+        safe_key = re.sub(r"[^0-9A-Za-z._-]", "_", handle)
+        return os.path.join(self.folder_path, f"{safe_key}.json")
+
+    def _write(self, handle, snapshot):
+        path = self._path(handle)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
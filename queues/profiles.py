@@ -0,0 +1,245 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from filelock import FileLock, Timeout
+
+WAIT_BUCKETS = [0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120]
+
+# Left behind in the user data dir when Chromium dies without cleaning up,
+# they make the next launch fail with "profile in use".
+CHROMIUM_SINGLETONS = ["SingletonLock", "SingletonSocket", "SingletonCookie"]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class ProfileLease:
+    def __init__(self, allocator, index, path, lock, ttl):
+        self.allocator = allocator
+        self.index = index
+        self.path = path
+        self.lock = lock
+        self.ttl = ttl
+        self.acquired_at = time.time()
+        self.expires_at = self.acquired_at + ttl
+        self.released = False
+        self.overdue = False
+
+    def renew(self):
+        if self.released:
+            return
+        self.expires_at = time.time() + self.ttl
+        self.overdue = False
+        self.allocator._write_lease_file(self)
+
+    def release(self):
+        self.allocator.release(self)
+
+    def to_dict(self):
+        return {
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            "acquired_at": self.acquired_at,
+            "expires_at": self.expires_at,
+        }
+
+
+class ProfileAllocator:
+    """
+    Hands out browser profiles to tasks in FIFO order. Free profiles are
+    taken at once with non-blocking file locks; waiters queue up and are
+    woken on release (same process) or on a short poll (other processes).
+    """
+
+    def __init__(
+        self,
+        folder_path,
+        num_profiles,
+        lease_ttl=3600,
+        acquire_timeout=60,
+        poll_interval=0.5,
+    ):
+        self.folder_path = folder_path
+        self.num_profiles = num_profiles
+        self.lease_ttl = lease_ttl
+        self.acquire_timeout = acquire_timeout
+        self.poll_interval = poll_interval
+
+        self._cond = threading.Condition()
+        self._waiters = deque()
+        self._leases = {}
+        self._started_at = time.time()
+        self._busy_seconds = 0.0
+        self._wait_histogram = [0] * (len(WAIT_BUCKETS) + 1)
+        self._wait_sum = 0.0
+        self._counters = {
+            "acquired": 0,
+            "released": 0,
+            "overdue": 0,
+            "timeouts": 0,
+            "recovered": 0,
+        }
+        os.makedirs(folder_path, exist_ok=True)
+
+    def profile_path(self, index):
+        return os.path.join(self.folder_path, f"profile_{index}")
+
+    def acquire(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        ticket = object()
+        with self._cond:
+            self._waiters.append(ticket)
+            try:
+                while True:
+                    self._flag_overdue()
+                    if self._waiters[0] is ticket:
+                        lease = self._try_acquire_free()
+                        if lease:
+                            self._waiters.popleft()
+                            self._record_wait(time.monotonic() - started)
+                            self._cond.notify_all()
+                            print(
+                                f"Acquired profile {lease.index} "
+                                + f"by {os.getpid()}"
+                            )
+                            return lease
+                    remaining = timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise Exception(
+                            f"No profile available after {timeout} "
+                            + "seconds. Please, try again later."
+                        )
+                    self._cond.wait(min(self.poll_interval, remaining))
+            except BaseException:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    self._cond.notify_all()
+                raise
+
+    def release(self, lease):
+        with self._cond:
+            if lease.released:
+                return
+            self._drop_lease(lease)
+            self._counters["released"] += 1
+            self._cond.notify_all()
+        print(f"Released profile {lease.index} by {os.getpid()}")
+
+    def stats(self):
+        with self._cond:
+            now = time.time()
+            busy = self._busy_seconds + sum(
+                now - lease.acquired_at for lease in self._leases.values()
+            )
+            elapsed = max(now - self._started_at, 1e-9)
+            buckets = {}
+            cumulative = 0
+            for bound, count in zip(
+                WAIT_BUCKETS + ["+Inf"], self._wait_histogram
+            ):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            return {
+                **self._counters,
+                "num_profiles": self.num_profiles,
+                "leased": sorted(self._leases),
+                "waiting": len(self._waiters),
+                "utilisation": round(
+                    busy / (elapsed * self.num_profiles), 4
+                ),
+                "wait_seconds": {
+                    "buckets": buckets,
+                    "count": cumulative,
+                    "sum": round(self._wait_sum, 4),
+                },
+            }
+
+    def _try_acquire_free(self):
+        for index in range(1, self.num_profiles + 1):
+            if index in self._leases:
+                continue
+            path = self.profile_path(index)
+            os.makedirs(path, exist_ok=True)
+            lock = FileLock(path + ".lock", thread_local=False)
+            try:
+                lock.acquire(timeout=0)
+            except Timeout:
+                continue
+            self._recover_crashed_holder(index, path)
+            lease = ProfileLease(self, index, path, lock, self.lease_ttl)
+            self._leases[index] = lease
+            self._counters["acquired"] += 1
+            self._write_lease_file(lease)
+            return lease
+        return None
+
+    def _recover_crashed_holder(self, index, path):
+        # Clean releases delete the lease file, so one still on disk means
+        # its holder died and Chromium may have left its singleton files.
+        previous = self._read_lease_file(path)
+        if not previous:
+            return
+        pid = previous.get("pid", -1)
+        if pid != os.getpid() and _pid_alive(pid):
+            return
+        for name in CHROMIUM_SINGLETONS:
+            target = os.path.join(path, name)
+            if os.path.lexists(target):
+                os.remove(target)
+        self._counters["recovered"] += 1
+        print(f"Recovered profile {index} from dead holder {previous}")
+
+    def _flag_overdue(self):
+        # Every lease held here belongs to this live process, and Chromium
+        # may still be running on the profile, so an overdue lease is only
+        # reported. Dead holders are covered by the flock and recovered in
+        # _recover_crashed_holder.
+        now = time.time()
+        for lease in self._leases.values():
+            if lease.expires_at < now and not lease.overdue:
+                lease.overdue = True
+                self._counters["overdue"] += 1
+                print(f"Lease on profile {lease.index} overdue, not renewed")
+
+    def _drop_lease(self, lease):
+        lease.released = True
+        self._leases.pop(lease.index, None)
+        self._busy_seconds += time.time() - lease.acquired_at
+        try:
+            os.remove(lease.path + ".lease")
+        except OSError:
+            pass
+        lease.lock.release()
+
+    def _record_wait(self, seconds):
+        self._wait_sum += seconds
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if seconds <= bound:
+                self._wait_histogram[i] += 1
+                return
+        self._wait_histogram[-1] += 1
+
+    def _write_lease_file(self, lease):
+        with open(lease.path + ".lease", "w", encoding="utf-8") as f:
+            json.dump(lease.to_dict(), f)
+
+    def _read_lease_file(self, path):
+        try:
+            with open(path + ".lease", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,67 @@
+import time
+
+
+class ScrapeBudget:
+    """
+    Upper bounds for one profile scrape: wall time, posts read and
+    comments kept per post. A limit of 0 or None means unbounded. The
+    time and post limits cutting the scrape short are recorded so the
+    result can be flagged as partial; the comment cap is a fixed shape
+    of every result and only counted.
+    """
+
+    def __init__(self, max_seconds=None, max_posts=None, max_comments=None):
+        self.max_seconds = max_seconds or None
+        self.max_posts = max_posts or None
+        self.max_comments = max_comments or None
+        self.started = time.monotonic()
+        self.reasons = set()
+        self.capped_posts = 0
+
+    def remaining(self):
+        if self.max_seconds is None:
+            return None
+        return max(0.0, self.max_seconds - (time.monotonic() - self.started))
+
+    def expired(self):
+        if self.remaining() == 0:
+            self.reasons.add("time")
+            return True
+        return False
+
+    def timeout_ms(self, default_ms):
+        remaining = self.remaining()
+        if remaining is None:
+            return default_ms
+        return max(1, min(default_ms, int(remaining * 1000)))
+
+    def take_posts(self, posts):
+        if self.max_posts is not None and len(posts) > self.max_posts:
+            self.reasons.add("posts")
+            return posts[: self.max_posts]
+        return posts
+
+    def has_comments(self, count):
+        """Whether `count` comments already fill the per-post limit."""
+        return self.max_comments is not None and count >= self.max_comments
+
+    def take_comments(self, comments):
+        if self.max_comments is not None and len(comments) > self.max_comments:
+            self.capped_posts += 1
+            return comments[: self.max_comments]
+        return comments
+
+    @property
+    def partial(self):
+        return bool(self.reasons)
+
+    def summary(self):
+        return {
+            "partial": self.partial,
+            "reasons": sorted(self.reasons),
+            "elapsed_seconds": round(time.monotonic() - self.started, 1),
+            "max_seconds": self.max_seconds,
+            "max_posts": self.max_posts,
+            "max_comments": self.max_comments,
+            "posts_with_capped_comments": self.capped_posts,
+        }
@@ -0,0 +1,309 @@
+"""
+Captcha OCR for the Supercias search form.
+
+The local model segments the captcha into glyphs and matches each one
+against templates learnt from labelled samples. In "auto" mode the LLM
+is only asked when the local answer is not confident enough, and answers
+the site accepts are stored as new labelled samples.
+
+Retrain from the collected corpus (from /queues):
+    python -m scrape.captcha train
+"""
+
+import argparse
+import asyncio
+import base64
+import glob
+import hashlib
+import io
+import os
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+from langchain_core.messages import HumanMessage
+
+from metrics import span, CAPTCHA_SOLVES
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+captcha_path = os.path.join(parent_dir, "captcha")
+model_path = os.path.join(captcha_path, "model.npz")
+corpus_path = os.path.join(captcha_path, "corpus")
+
+OCR_BACKENDS = ["auto", "local", "llm"]
+GLYPH_SIZE = (12, 16)
+MIN_GLYPH_PIXELS = 15
+
+
+def load_gray(data: bytes):
+    image = Image.open(io.BytesIO(data)).convert("L")
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def ink_mask(gray):
+    # Otsu threshold, ink is whichever side of it covers less of the image
+    hist, edges = np.histogram(gray, bins=64, range=(0.0, 1.0))
+    weights = hist / max(hist.sum(), 1)
+    centers = (edges[:-1] + edges[1:]) / 2
+    best, threshold = -1.0, 0.5
+    for i in range(1, len(hist)):
+        w0, w1 = weights[:i].sum(), weights[i:].sum()
+        if not w0 or not w1:
+            continue
+        m0 = (weights[:i] * centers[:i]).sum() / w0
+        m1 = (weights[i:] * centers[i:]).sum() / w1
+        variance = w0 * w1 * (m0 - m1) ** 2
+        if variance > best:
+            best, threshold = variance, edges[i]
+    mask = gray < threshold
+    return despeckle(mask if mask.mean() < 0.5 else ~mask)
+
+
+def despeckle(mask):
+    # 2x2 opening, drops the one pixel noise lines and dots drawn over
+    # the text while keeping the thicker glyph strokes
+    core = mask[:-1, :-1] & mask[1:, :-1] & mask[:-1, 1:] & mask[1:, 1:]
+    opened = np.zeros_like(mask)
+    opened[:-1, :-1] |= core
+    opened[1:, :-1] |= core
+    opened[:-1, 1:] |= core
+    opened[1:, 1:] |= core
+    return opened
+
+
+def segment(gray, expected=None):
+    """Split the captcha into glyph crops by column projection."""
+    mask = ink_mask(gray)
+    columns = mask.sum(axis=0) > 0
+    runs, start = [], None
+    for x, has_ink in enumerate(list(columns) + [False]):
+        if has_ink and start is None:
+            start = x
+        elif not has_ink and start is not None:
+            if mask[:, start:x].sum() >= MIN_GLYPH_PIXELS:
+                runs.append((start, x))
+            start = None
+
+    # Broken glyphs show up as extra narrow runs, fold each into the
+    # closest neighbour
+    while expected and len(runs) > expected:
+        i = min(range(len(runs)), key=lambda j: runs[j][1] - runs[j][0])
+        if i == 0:
+            j = 1
+        elif i == len(runs) - 1:
+            j = i - 1
+        else:
+            left_gap = runs[i][0] - runs[i - 1][1]
+            right_gap = runs[i + 1][0] - runs[i][1]
+            j = i - 1 if left_gap <= right_gap else i + 1
+        a, b = sorted((i, j))
+        runs[a : b + 1] = [(runs[a][0], runs[b][1])]
+
+    # Touching glyphs show up as wide runs, split them evenly
+    if runs and not (expected and len(runs) == expected):
+        widths = [end - begin for begin, end in runs]
+        typical = float(np.median(widths))
+        if expected and len(runs) < expected:
+            typical = sum(widths) / expected
+        split = []
+        for begin, end in runs:
+            pieces = max(1, round((end - begin) / typical))
+            step = (end - begin) / pieces
+            for i in range(pieces):
+                split.append(
+                    (begin + round(i * step), begin + round((i + 1) * step))
+                )
+        runs = split
+
+    glyphs = []
+    for begin, end in runs:
+        crop = mask[:, begin:end]
+        rows = np.where(crop.any(axis=1))[0]
+        if not len(rows):
+            continue
+        crop = crop[rows[0] : rows[-1] + 1]
+        image = Image.fromarray((crop * 255).astype(np.uint8))
+        image = image.resize(GLYPH_SIZE, Image.BILINEAR)
+        vector = np.asarray(image, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        glyphs.append(vector / norm if norm else vector)
+    return glyphs
+
+
+class LocalCaptchaModel:
+    def __init__(self, labels, templates, length=None):
+        self.labels = np.asarray(labels)
+        self.templates = np.asarray(templates, dtype=np.float32)
+        # Usual answer length, helps splitting glyphs that touch
+        self.length = int(length) if length else None
+
+    @classmethod
+    def train(cls, samples):
+        labels, templates, skipped = [], [], 0
+        lengths = Counter(len(text) for _, text in samples)
+        for data, text in samples:
+            glyphs = segment(load_gray(data), expected=len(text))
+            if len(glyphs) != len(text):
+                skipped += 1
+                continue
+            labels.extend(text)
+            templates.extend(glyphs)
+        if not templates:
+            raise ValueError("No usable captcha samples to train on")
+        print(
+            f"Captcha model: {len(templates)} glyphs, "
+            + f"{len(set(labels))} symbols, {skipped} samples skipped"
+        )
+        return cls(labels, templates, lengths.most_common(1)[0][0])
+
+    @classmethod
+    def load(cls, path=model_path):
+        data = np.load(path)
+        return cls(data["labels"], data["templates"], data["length"])
+
+    def save(self, path=model_path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez_compressed(
+            path,
+            labels=self.labels,
+            templates=self.templates,
+            length=self.length or 0,
+        )
+
+    def predict(self, data: bytes):
+        """Return the text and a 0-1 confidence (the least sure glyph)."""
+        glyphs = segment(load_gray(data), expected=self.length)
+        if not glyphs:
+            return "", 0.0
+        text, confidence = [], 1.0
+        for glyph in glyphs:
+            scores = self.templates @ glyph
+            best = int(np.argmax(scores))
+            label = self.labels[best]
+            others = scores[self.labels != label]
+            runner_up = float(others.max()) if len(others) else 0.0
+            # 1 for an exact template, 0 when another symbol is as close
+            margin = 1 - (1 - scores[best]) / max(1 - runner_up, 1e-6)
+            text.append(str(label))
+            confidence = min(confidence, max(0.0, float(margin)))
+        return "".join(text), confidence
+
+
+@dataclass
+class CaptchaAnswer:
+    text: str
+    confidence: float
+    backend: str
+    image: bytes
+
+
+class CaptchaSolver:
+    def __init__(
+        self,
+        llm,
+        mode="auto",
+        min_confidence=0.5,
+        collect_samples=True,
+        model_file=model_path,
+        corpus_dir=corpus_path,
+    ):
+        if mode not in OCR_BACKENDS:
+            raise ValueError(f"Unknown captcha OCR backend: {mode}")
+        self.llm = llm
+        self.mode = mode
+        self.min_confidence = min_confidence
+        self.collect_samples = collect_samples
+        self.model_file = model_file
+        self.corpus_dir = corpus_dir
+        self._model = None
+        self._model_mtime = None
+
+    @property
+    def model(self):
+        # Picks up a retrained model without restarting the worker
+        if not os.path.exists(self.model_file):
+            return None
+        mtime = os.path.getmtime(self.model_file)
+        if mtime != self._model_mtime:
+            self._model = LocalCaptchaModel.load(self.model_file)
+            self._model_mtime = mtime
+        return self._model
+
+    async def solve(self, data: bytes) -> CaptchaAnswer:
+        # Loading and running the model is numpy work, kept off the loop
+        model = None
+        if self.mode != "llm":
+            model = await asyncio.to_thread(lambda: self.model)
+        if model is not None:
+            with span("captcha_local"):
+                text, confidence = await asyncio.to_thread(
+                    model.predict, data
+                )
+            if self.mode == "local" or confidence >= self.min_confidence:
+                CAPTCHA_SOLVES.labels("local").inc()
+                return CaptchaAnswer(text, confidence, "local", data)
+        elif self.mode == "local":
+            raise FileNotFoundError(
+                f"No captcha model at {self.model_file}, train one first"
+            )
+
+        async with span("captcha_llm"):
+            text = await self.llm_ocr(data)
+        CAPTCHA_SOLVES.labels("llm").inc()
+        return CaptchaAnswer(text, 1.0, "llm", data)
+
+    async def llm_ocr(self, data: bytes):
+        img_b64 = base64.b64encode(data).decode()
+        message = HumanMessage(
+            content=[
+                {
+                    "type": "text",
+                    "text": "Eres un OCR, dame el texto que veas en la "
+                    + "imagen, solo el texto, no hay que dar explicaciones",
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/png;base64,{img_b64}"},
+                },
+            ]
+        )
+        response = await self.llm.ainvoke([message])
+        return response.content.strip()
+
+    def accepted(self, answer: CaptchaAnswer):
+        """Store an answer the site accepted as a labelled sample."""
+        if not self.collect_samples or answer.backend != "llm":
+            return
+        text = answer.text.strip()
+        if not text.isalnum():
+            return
+        os.makedirs(self.corpus_dir, exist_ok=True)
+        digest = hashlib.sha256(answer.image).hexdigest()[:12]
+        path = os.path.join(self.corpus_dir, f"{text}_{digest}.png")
+        with open(path, "wb") as f:
+            f.write(answer.image)
+
+
+def load_corpus(folder=corpus_path):
+    """Labelled samples are stored as <text>_<anything>.png."""
+    samples = []
+    for path in sorted(glob.glob(os.path.join(folder, "*.png"))):
+        label = os.path.basename(path).split("_")[0]
+        with open(path, "rb") as f:
+            samples.append((f.read(), label))
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["train"])
+    parser.add_argument("--corpus", default=corpus_path)
+    parser.add_argument("--out", default=model_path)
+    args = parser.parse_args()
+
+    samples = load_corpus(args.corpus)
+    print(f"Training on {len(samples)} samples from {args.corpus}")
+    LocalCaptchaModel.train(samples).save(args.out)
+    print(f"Model saved to {args.out}")
@@ -0,0 +1,101 @@
+"""
+Local parsing of the counts Instagram prints, in Spanish and English:
+"1.234", "1,2 mil", "3 M", "12.5K", "Le gusta a X y 35 personas más",
+"Liked by X and 35 others". Every parser returns None when it cannot
+tell, so callers can fall back to the LLM.
+"""
+
+import re
+
+MULTIPLIERS = {
+    "mil": 1_000,
+    "k": 1_000,
+    "m": 1_000_000,
+    "mm": 1_000_000,
+    "mill": 1_000_000,
+    "millón": 1_000_000,
+    "millon": 1_000_000,
+    "millones": 1_000_000,
+    "b": 1_000_000_000,
+}
+
+NUMBER = re.compile(
+    r"(?<![\w.,])(\d+(?:[.,]\d+|[ \u00a0]\d{3}(?!\d))*)\s*"
+    r"(millones|millón|millon|mill|mil|mm|k|m|b)?(?!\w)",
+    re.I,
+)
+NO_NUMBERS = {"ninguno", "ninguna", "none", "no", ""}
+OTHERS = re.compile(
+    r"(?:y|and)\s+(?:otras?\s+)?(\S+(?:\s+(?:mil|k|m))?)\s+"
+    r"(?:personas|persona|otras|otros|others|other)",
+    re.I,
+)
+NO_LIKES = re.compile(
+    r"sé el primero|se el primero|be the first|^\s*me gusta\s*$|"
+    r"^\s*responder\s*$|^\s*reply\s*$",
+    re.I,
+)
+LIKED_BY = re.compile(r"le gusta a|les gusta a|liked by", re.I)
+SOMEONE_ELSE = re.compile(r"\b(?:personas|otras|otros|others)\b", re.I)
+
+
+def _to_number(digits, suffix):
+    digits = re.sub(r"\s", "", digits)
+    multiplier = MULTIPLIERS.get((suffix or "").lower(), 1)
+    separators = re.findall(r"[.,]", digits)
+    groups = re.split(r"[.,]", digits)
+    if not separators:
+        value = float(digits)
+    elif multiplier > 1 and len(groups) == 2:
+        # "1,2 mil", "12.5K": the separator is the decimal point
+        value = float(f"{groups[0]}.{groups[1]}")
+    elif all(len(group) == 3 for group in groups[1:]):
+        # "1.234", "1,234,567": thousands separators
+        value = float("".join(groups))
+    elif len(groups) == 2:
+        value = float(f"{groups[0]}.{groups[1]}")
+    else:
+        return None
+    return int(round(value * multiplier))
+
+
+def parse_counts(text):
+    """Every number in the text, in order, or None if one is ambiguous."""
+    if text is None:
+        return None
+    if text.strip().lower() in NO_NUMBERS:
+        return []
+    numbers = []
+    for match in NUMBER.finditer(text):
+        number = _to_number(match.group(1), match.group(2))
+        if number is None:
+            return None
+        numbers.append(number)
+    return numbers
+
+
+def parse_count(text):
+    numbers = parse_counts(text)
+    if not numbers:
+        return None
+    return numbers[0]
+
+
+def parse_likes(text):
+    """Likes of a post or comment, None when the text is not understood."""
+    if text is None:
+        return None
+    if NO_LIKES.search(text):
+        return 0
+    if LIKED_BY.search(text):
+        # "Le gusta a ana y 35 personas más": the named user plus the rest
+        others = OTHERS.search(text)
+        if not others:
+            # "Liked by ana and others" has no count to read
+            return None if SOMEONE_ELSE.search(text) else 1
+        count = parse_count(others.group(1))
+        return None if count is None else count + 1
+    numbers = parse_counts(text)
+    if numbers and len(numbers) == 1:
+        return numbers[0]
+    return None
@@ -0,0 +1,150 @@
+"""
+Days since an Instagram post, read from its <time> element: the ISO
+datetime attribute when present, otherwise the Spanish or English text
+("hace 3 días", "2 sem", "14 de marzo", "March 14, 2023"). Returns None
+when it cannot tell, so callers can fall back to the LLM.
+"""
+
+import re
+from datetime import date, datetime, timedelta
+
+MONTHS = {
+    "enero": 1,
+    "ene": 1,
+    "january": 1,
+    "jan": 1,
+    "febrero": 2,
+    "feb": 2,
+    "february": 2,
+    "marzo": 3,
+    "mar": 3,
+    "march": 3,
+    "abril": 4,
+    "abr": 4,
+    "april": 4,
+    "apr": 4,
+    "mayo": 5,
+    "may": 5,
+    "junio": 6,
+    "jun": 6,
+    "june": 6,
+    "julio": 7,
+    "jul": 7,
+    "july": 7,
+    "agosto": 8,
+    "ago": 8,
+    "august": 8,
+    "aug": 8,
+    "septiembre": 9,
+    "setiembre": 9,
+    "sep": 9,
+    "sept": 9,
+    "september": 9,
+    "octubre": 10,
+    "oct": 10,
+    "october": 10,
+    "noviembre": 11,
+    "nov": 11,
+    "november": 11,
+    "diciembre": 12,
+    "dic": 12,
+    "december": 12,
+    "dec": 12,
+}
+
+# Days per unit; months and years are close enough for post age
+UNITS = [
+    (r"s|seg|segundos?|sec|seconds?", 0),
+    (r"min|minutos?|minutes?|m", 0),
+    (r"h|horas?|hours?", 0),
+    (r"d|días?|dias?|days?", 1),
+    (r"sem|semanas?|w|weeks?", 7),
+    (r"mes|meses|months?|mo", 30),
+    (r"a|años?|anos?|y|years?", 365),
+]
+RELATIVE = re.compile(
+    r"^(?:hace\s+)?(\d+|un|una|a|an)\s*("
+    + "|".join(pattern for pattern, _ in UNITS)
+    + r")\.?(?:\s+ago)?$",
+    re.I,
+)
+DAY_MONTH = re.compile(
+    r"^(\d{1,2})\s+(?:de\s+)?([a-zé]+)\.?(?:,?\s+(?:de\s+)?(\d{4}))?$",
+    re.I,
+)
+MONTH_DAY = re.compile(r"^([a-z]+)\.?\s+(\d{1,2}),?(?:\s+(\d{4}))?$", re.I)
+
+
+def _unit_days(unit):
+    for pattern, days in UNITS:
+        if re.fullmatch(pattern, unit, re.I):
+            return days
+    return None
+
+
+def _absolute(day, month, year, today):
+    if month is None:
+        return None
+    try:
+        if year:
+            return date(int(year), month, int(day))
+        posted = date(today.year, month, int(day))
+    except ValueError:
+        return None
+    # Without a year Instagram means the latest such date
+    if posted > today:
+        posted = posted.replace(year=today.year - 1)
+    return posted
+
+
+def parse_post_date(text, today=None):
+    today = today or datetime.now().date()
+    text = re.sub(r"\s+", " ", (text or "").strip().lower())
+    if not text:
+        return None
+    if text in ("hoy", "today", "ahora", "now", "justo ahora"):
+        return today
+    if text in ("ayer", "yesterday"):
+        return today - timedelta(days=1)
+
+    relative = RELATIVE.match(text)
+    if relative:
+        amount, unit = relative.groups()
+        count = int(amount) if amount.isdigit() else 1
+        days = _unit_days(unit)
+        if days is not None:
+            return today - timedelta(days=count * days)
+
+    day_month = DAY_MONTH.match(text)
+    if day_month:
+        day, month, year = day_month.groups()
+        return _absolute(day, MONTHS.get(month), year, today)
+    month_day = MONTH_DAY.match(text)
+    if month_day:
+        month, day, year = month_day.groups()
+        return _absolute(day, MONTHS.get(month), year, today)
+
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def parse_datetime_attribute(value):
+    """Local date of an ISO timestamp such as 2024-03-14T15:02:11.000Z."""
+    if not value:
+        return None
+    try:
+        posted = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if posted.tzinfo:
+        posted = posted.astimezone()
+    return posted.date()
+
+
+def days_since(posted, today=None):
+    if posted is None:
+        return None
+    today = today or datetime.now().date()
+    return (today - posted).days
@@ -1,28 +1,44 @@
+import asyncio
 import json
 import os
-import asyncio
-from playwright.async_api import Page, ElementHandle
+import re
+from playwright.async_api import Page
 from datetime import datetime
+from urllib.parse import urlparse
 from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
 from config import general_settings
-
-API_KEY = general_settings.API_KEY
+from llm_gateway import llm
+from metrics import timed, count_bytes
+from post_snapshots import PostSnapshotStore
+from scrape_cache import instagram_handle
+from .counts import parse_count, parse_counts, parse_likes
+from .dates import days_since, parse_datetime_attribute, parse_post_date
+from .budget import ScrapeBudget
+from .instagram_payloads import InstagramPayloads
+from .routing import RequestFilter
+from .pacing import Pacer
+
+REQUEST_FILTER_MODE = general_settings.REQUEST_FILTER_MODE
 IG_USERNAME = general_settings.IG_USERNAME
 IG_PASSWORD = general_settings.IG_PASSWORD
+DATE_LLM_FALLBACK = general_settings.INSTAGRAM_DATE_LLM_FALLBACK
+POST_TABS = general_settings.INSTAGRAM_POST_TABS
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 
+IG_BASE_URL = "https://www.instagram.com"
 
-llm = ChatOpenAI(
-    model="gpt-4.1",
-    openai_api_key=API_KEY,
-    temperature=0.2,
+post_snapshots = PostSnapshotStore(
+    os.path.join(parent_dir, "post_snapshots"),
+    refresh_rate=general_settings.INSTAGRAM_SNAPSHOT_REFRESH_RATE,
+    half_life_days=general_settings.INSTAGRAM_SNAPSHOT_HALF_LIFE_DAYS,
+    max_refresh=general_settings.INSTAGRAM_SNAPSHOT_MAX_REFRESH,
 )
 
 
-def get_likes_from_text(llm, content):
+@timed("llm_likes_from_text")
+async def get_likes_from_text(llm, content):
     message = HumanMessage(
         content=[
             {
@@ -41,12 +57,12 @@ def get_likes_from_text(llm, content):
         ]
     )
 
-    response = llm.invoke([message])
+    response = await llm.ainvoke([message])
     return response.content
 
 
-def get_number_from_text(llm, content):
-    message = HumanMessage(
+def number_message(content):
+    return HumanMessage(
         content=[
             {
                 "type": "text",
@@ -61,11 +77,79 @@ def get_number_from_text(llm, content):
         ]
     )
 
-    response = llm.invoke([message])
+
+@timed("llm_number_from_text")
+async def get_number_from_text(llm, content):
+    response = await llm.ainvoke([number_message(content)])
     return response.content
 
 
-def get_days_from_date(llm, post_date):
+@timed("llm_numbers_from_texts")
+async def get_numbers_from_texts(llm, contents):
+    """One number per text, asked in a single call when possible."""
+    if not contents:
+        return []
+    numbered = "\n".join(
+        f"{i + 1}. '{content}'" for i, content in enumerate(contents)
+    )
+    message = HumanMessage(
+        content=[
+            {
+                "type": "text",
+                "text": "Eres un analizador de números escritos con palabras. "
+                + "Para cada texto numerado devuelve una línea con el "
+                + "número que contiene, en el mismo orden y sin "
+                + "explicaciones. Si un texto no tiene número, devuelve 0.",
+            },
+            {
+                "type": "text",
+                "text": f"Los textos son:\n{numbered}",
+            },
+        ]
+    )
+    response = await llm.ainvoke([message])
+    lines = [line for line in response.content.splitlines() if line.strip()]
+    if len(lines) == len(contents):
+        return [
+            parse_count(re.sub(r"^\s*\d+[.)]\s+", "", line))
+            for line in lines
+        ]
+    # The answer does not line up with the texts, ask one by one
+    responses = await llm.abatch(
+        [[number_message(content)] for content in contents]
+    )
+    return [parse_count(response.content) for response in responses]
+
+
+async def post_likes(content):
+    likes = parse_likes(content)
+    if likes is None:
+        return await get_likes_from_text(llm, content)
+    return str(likes)
+
+
+async def comments_likes(contents):
+    likes = [parse_likes(content) for content in contents]
+    unknown = [i for i, count in enumerate(likes) if count is None]
+    if unknown:
+        answers = await get_numbers_from_texts(
+            llm, [contents[i] for i in unknown]
+        )
+        for i, answer in zip(unknown, answers):
+            likes[i] = answer
+    return [count or 0 for count in likes]
+
+
+async def profile_counts(content):
+    """Posts, followers and following, parsed locally when possible."""
+    counts = parse_counts(content)
+    if counts is not None and len(counts) == 3:
+        return [str(count) for count in counts]
+    return (await get_number_from_text(llm, content)).split(",")
+
+
+@timed("llm_days_from_date")
+async def get_days_from_date(llm, post_date):
     curr_date = datetime.now().strftime("%Y-%m-%d")
     message = HumanMessage(
         content=[
@@ -87,7 +171,7 @@ def get_days_from_date(llm, post_date):
         ]
     )
 
-    response = llm.invoke([message])
+    response = await llm.ainvoke([message])
     post_date = datetime.now().date()
     try:
         post_date = datetime.strptime(response.content, "%Y-%m-%d").date()
@@ -98,89 +182,185 @@ def get_days_from_date(llm, post_date):
     return diff.days
 
 
-async def load_comments(page: Page, times: int):
+async def post_age_days(datetime_value, text):
+    posted = parse_datetime_attribute(datetime_value)
+    if posted is None:
+        posted = parse_post_date(text)
+    if posted is not None:
+        return days_since(posted)
+    if DATE_LLM_FALLBACK:
+        return await get_days_from_date(llm, text)
+    return None
+
+
+async def load_comments(page: Page, times: int, budget=None):
+    budget = budget or ScrapeBudget()
     for _ in range(times):
+        if budget.expired():
+            return
+        if budget.max_comments and budget.has_comments(
+            await page.evaluate(COUNT_COMMENTS_JS)
+        ):
+            return
         try:
             load_button = await page.wait_for_selector(
-                "ul._a9z6._a9za > div button._abl-", timeout=1000
+                "ul._a9z6._a9za > div button._abl-",
+                timeout=budget.timeout_ms(1000),
             )
             await load_button.click()
             await page.wait_for_selector(
-                "div[role='progressbar']", state="detached", timeout=1000
+                "div[role='progressbar']",
+                state="detached",
+                timeout=budget.timeout_ms(1000),
             )
         except Exception:
             return
 
 
-async def get_post_info(page: Page, post: ElementHandle):
-    await post.click()
-    await asyncio.sleep(0.2)
-
-    dummy_content = {
-        "description": "",
-        "comments": [],
-    }
-    try:
-        await page.wait_for_selector("ul._a9z6._a9za > div", timeout=3000)
-        sections = await page.query_selector_all("ul._a9z6._a9za > div")
-        description = await sections[0].query_selector("div._a9zr > div")
-        description_text = await description.inner_text()
-        parsed_description = description_text.strip().replace("\n", " ")
-        dummy_content["description"] = parsed_description
-        comments_section = await sections[-1].query_selector("> div > div")
-        await load_comments(page, 3)
-        all_comments = await comments_section.query_selector_all("> div")
-        comments_info = []
-        for comment in all_comments:
-            comment_container = await comment.query_selector("div._a9zr")
-            comment_text = await comment_container.query_selector(
-                "div.xt0psk2 > span"
-            )
-            likes = await comment_container.query_selector_all("> div")
-            likes_element = await likes[-1].query_selector("button")
-            likes_text = await likes_element.text_content()
-            num_likes = 0
-            try:
-                if "Responder" not in likes_text:
-                    num_likes = int(likes_text.split(" ")[0])
-            except Exception:
-                num_likes = get_number_from_text(llm, likes_text)
-
-            comments_info.append(
-                {
-                    "comment": await comment_text.text_content(),
-                    "likes": num_likes if num_likes != "ninguno" else 0,
-                }
-            )
-        dummy_content["comments"] = comments_info
-    except Exception:
-        pass
-
-    likes_section = await page.query_selector(
-        ".html-div.xexx8yu.xyri2b.x18d9i69.x1c1uobl.x9f619.xjbqb8w.x78zum5"
-        + ".x15mokao.x1ga7v0g.x16uus16.xbiv7yw.xr1yuqi"
-    )
-    likes_text = await likes_section.inner_text()
-    num_likes_post = get_likes_from_text(llm, likes_text)
-
-    last_day = await page.query_selector("div.x1yztbdb.x1h3rv7z.xf7dkkf time")
-    last_day_text = await last_day.text_content()
-    num_days = get_days_from_date(llm, last_day_text)
-
-    close_button = await page.wait_for_selector(
-        ".xo2ifbc.x10l6tqk.x1eu8d0j.x1vjfegm > div > div"
+COUNT_COMMENTS_JS = """
+() => {
+  const sections = document.querySelectorAll("ul._a9z6._a9za > div");
+  const list =
+    sections.length &&
+    sections[sections.length - 1].querySelector(":scope > div > div");
+  return list ? list.querySelectorAll(":scope > div").length : 0;
+}
+"""
+
+# Everything get_post_info needs, read in a single round trip
+READ_POST_JS = """
+() => {
+  const text = (el) => (el ? el.textContent : null);
+  const sections = [...document.querySelectorAll("ul._a9z6._a9za > div")];
+  const description =
+    sections.length && sections[0].querySelector("div._a9zr > div");
+  const commentsSection =
+    sections.length &&
+    sections[sections.length - 1].querySelector(":scope > div > div");
+  const comments = [];
+  for (const comment of commentsSection
+    ? commentsSection.querySelectorAll(":scope > div")
+    : []) {
+    const container = comment.querySelector("div._a9zr");
+    if (!container) continue;
+    const parts = container.querySelectorAll(":scope > div");
+    const button =
+      parts.length && parts[parts.length - 1].querySelector("button");
+    const body = container.querySelector("div.xt0psk2 > span");
+    if (!body || !button) continue;
+    comments.push({ comment: text(body), likes_text: text(button) });
+  }
+  const likes = document.querySelector(
+    ".html-div.xexx8yu.xyri2b.x18d9i69.x1c1uobl.x9f619.xjbqb8w.x78zum5" +
+      ".x15mokao.x1ga7v0g.x16uus16.xbiv7yw.xr1yuqi"
+  );
+  const time = document.querySelector("div.x1yztbdb.x1h3rv7z.xf7dkkf time");
+  return {
+    description: description ? description.innerText : null,
+    comments,
+    likes_text: likes ? likes.innerText : null,
+    datetime: time ? time.getAttribute("datetime") : null,
+    time_text: text(time),
+  };
+}
+"""
+
+
+async def read_post(page: Page):
+    return await page.evaluate(READ_POST_JS)
+
+
+@timed("instagram_post")
+async def get_post_info(page: Page, pacer: Pacer, budget=None):
+    """Read the post shown on its permalink page."""
+    if await pacer.selector(page, "ul._a9z6._a9za > div", timeout=5000):
+        await load_comments(page, 3, budget)
+    post = await read_post(page)
+    if post["likes_text"] is None:
+        raise ValueError("Post sin sección de likes")
+
+    # Texts the parser cannot read go to the LLM in a single call
+    likes = await comments_likes(
+        [comment["likes_text"] for comment in post["comments"]]
     )
-    await close_button.click()
-
     return {
-        "description": dummy_content["description"],
-        "likes": num_likes_post,
-        "last_day": num_days,
-        "comments": dummy_content["comments"],
+        "description": (post["description"] or "")
+        .strip()
+        .replace("\n", " "),
+        "likes": await post_likes(post["likes_text"]),
+        "last_day": await post_age_days(post["datetime"], post["time_text"]),
+        "comments": [
+            {"comment": comment["comment"], "likes": count}
+            for comment, count in zip(post["comments"], likes)
+        ],
     }
 
 
-async def get_rows(page: Page, min_rows: int = 5, retries: int = 3):
+def last_path_segment(url):
+    # The handle of a profile URL, the shortcode of a post permalink
+    return urlparse(url).path.rstrip("/").split("/")[-1]
+
+
+async def get_posts_info(
+    context, pacer, request_filter, payloads, urls, tabs, budget=None
+):
+    """
+    Open the post permalinks in up to `tabs` pages of the logged-in
+    context and return their info in grid order. Posts whose payloads
+    were already intercepted skip the DOM, posts that fail or are left
+    when the time budget runs out are None.
+    """
+    budget = budget or ScrapeBudget()
+    queue = asyncio.Queue()
+    results = [None] * len(urls)
+    for index, url in enumerate(urls):
+        info = payloads.post(last_path_segment(url))
+        if info is None:
+            queue.put_nowait((index, url))
+        else:
+            info["comments"] = budget.take_comments(info["comments"])
+            results[index] = info
+
+    async def read(page, url):
+        await page.goto(url)
+        await payloads.settle()
+        info = payloads.post(last_path_segment(url)) or await get_post_info(
+            page, pacer, budget
+        )
+        info["comments"] = budget.take_comments(info["comments"])
+        return info
+
+    async def worker():
+        page = None
+        try:
+            while not queue.empty() and not budget.expired():
+                index, url = queue.get_nowait()
+                if page is None or page.is_closed():
+                    page = await context.new_page()
+                    await request_filter.install(page)
+                    payloads.attach(page)
+                try:
+                    results[index] = await asyncio.wait_for(
+                        read(page, url), timeout=budget.remaining()
+                    )
+                except asyncio.TimeoutError:
+                    budget.reasons.add("time")
+                    print(f"Tiempo agotado leyendo el post {url}")
+                except Exception as e:
+                    print(f"Error al leer el post {url}: {e}")
+                await pacer.pause()
+        finally:
+            if page is not None and not page.is_closed():
+                await page.close()
+
+    await asyncio.gather(*[worker() for _ in range(max(1, tabs))])
+    return results
+
+
+async def get_rows(
+    page: Page, min_rows: int = 5, retries: int = 3, budget=None
+):
+    budget = budget or ScrapeBudget()
     try:
         post_container = await page.query_selector(".xg7h5cd.x1n2onr6")
         prev_rows = await post_container.query_selector_all(
@@ -189,6 +369,8 @@ async def get_rows(page: Page, min_rows: int = 5, retries: int = 3):
     except Exception:
         return [], False
     while (len(prev_rows) < min_rows) and (retries > 0):
+        if budget.expired():
+            break
         await page.evaluate(
             """
             window.scrollTo(0, document.body.scrollHeight);
@@ -199,7 +381,7 @@ async def get_rows(page: Page, min_rows: int = 5, retries: int = 3):
                 ".html-div.x14z9mp.xat24cr.x1lziwak.xexx8yu.xyri2b.x18d9i69"
                 + ".x1c1uobl.x9f619.x16ye13r",
                 state="detached",
-                timeout=3000,
+                timeout=budget.timeout_ms(3000),
             )
         except Exception:
             pass
@@ -213,66 +395,50 @@ async def get_rows(page: Page, min_rows: int = 5, retries: int = 3):
     return prev_rows, True
 
 
-async def attemp_to_login(page: Page):
+@timed("instagram_login")
+async def attemp_to_login(page: Page, pacer: Pacer):
     try:
         await page.wait_for_selector("input[name='username']", timeout=2000)
 
         await page.type(
             "input[name='username']",
             IG_USERNAME,
-            delay=100,
+            delay=pacer.type_delay(),
         )
-        await asyncio.sleep(0.2)
-        await page.type("input[name='password']", IG_PASSWORD, delay=150)
-        await asyncio.sleep(1)
-        await page.click("button[type='submit']", delay=100)
+        await pacer.pause()
+        await page.type(
+            "input[name='password']", IG_PASSWORD, delay=pacer.type_delay()
+        )
+        await pacer.pause()
+        await page.click("button[type='submit']")
+        await page.wait_for_selector(
+            "input[name='username']", state="detached", timeout=15000
+        )
+        await pacer.network_idle(page)
     except Exception:
         print("Ya logeado")
 
 
-async def scrape_instagram(browser, url, uid):
-    folder_path = os.path.join(parent_dir, "generated")
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-
-    page = await browser.new_page()
-    await page.goto("https://www.instagram.com")
-
-    await attemp_to_login(page)
-
-    # print("Inicio de sesión exitoso")
-    await asyncio.sleep(3)
-
-    await page.goto(url)
+async def get_profile_info(page: Page):
+    """Profile header read from the DOM, None if the profile is missing."""
     name_container = await page.query_selector("h2.x1lliihq")
     if not name_container:
-        await page.close()
-        early_json = {
-            "profile": {},
-            "posts": [],
-        }
-        with open(f"{folder_path}/{uid}.json", "w", encoding="utf-8") as f:
-            json.dump(early_json, f, indent=4, ensure_ascii=False)
-        return early_json
+        return None
 
     name = await name_container.inner_text()
-    # print("name", name)
 
     profile_follows = await page.query_selector_all(
         ".xc3tme8.x1xdureb.x18wylqe.x13vxnyz.xvxrpd7 > ul > li"
     )
-    # print("len(profile_follows)", len(profile_follows))
     profile_texts = []
     for follow in profile_follows:
         text = await follow.inner_text()
         profile_texts.append(text)
 
     profile_follows_text = "\n".join(profile_texts)
-    # print("profile_follows_text", profile_follows_text)
-    post_num, follower_num, following_num = get_number_from_text(
-        llm, profile_follows_text
-    ).split(",")
-    # print(post_num, follower_num, following_num)
+    post_num, follower_num, following_num = await profile_counts(
+        profile_follows_text
+    )
 
     description = await page.query_selector(".x7a106z")
     description_text = await description.inner_text()
@@ -284,55 +450,152 @@ async def scrape_instagram(browser, url, uid):
     is_verified = False
     if verified:
         is_verified = "Verificado" in await verified.text_content()
-    # print(is_verified)
 
-    rows, is_public = await get_rows(page, min_rows=3)
+    return {
+        "name": name,
+        "description": parsed_description,
+        "is_verified": is_verified,
+        "post_num": post_num,
+        "follower_num": follower_num,
+        "following_num": following_num,
+    }
+
+
+def profile_handle(url):
+    # Profiles sit right below IG_BASE_URL, which has a path of its own
+    # when the benchmark serves the fixtures
+    path = urlparse(url).path
+    base_path = urlparse(IG_BASE_URL).path.rstrip("/")
+    if base_path and path.startswith(base_path + "/"):
+        path = path[len(base_path) :]
+    return instagram_handle(path)
 
-    # print(len(rows))
-    all_posts = []
-    all_posts_handles = []
-    for row in rows:
-        curr_posts = await row.query_selector_all("a")
-        all_posts_handles += curr_posts
-        for post in curr_posts:
-            href = await post.get_attribute("href")
-            final_href = f"https://www.instagram.com{href}"
-            all_posts.append(final_href)
 
-    # print(len(all_posts))
+def write_json(path, data, indent):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
 
-    posts_info = []
-    for post in all_posts_handles:
-        results = await get_post_info(page, post)
-        posts_info.append(results)
-        await asyncio.sleep(0.5)
+
+async def scrape_instagram(
+    browser, url, uid, pacing="fast", post_tabs=None, budget=None
+):
+    pacer = Pacer(pacing)
+    budget = budget or ScrapeBudget(
+        max_seconds=general_settings.INSTAGRAM_MAX_SECONDS,
+        max_posts=general_settings.INSTAGRAM_MAX_POSTS,
+        max_comments=general_settings.INSTAGRAM_MAX_COMMENTS,
+    )
+    folder_path = os.path.join(parent_dir, "generated")
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+
+    page = await browser.new_page()
+    request_filter = await RequestFilter(
+        "instagram", REQUEST_FILTER_MODE
+    ).install(page)
+    payloads = InstagramPayloads().attach(page)
+    await page.goto(IG_BASE_URL)
+
+    await attemp_to_login(page, pacer)
+
+    await page.goto(url)
+    await pacer.selector(page, "h2.x1lliihq")
+    await payloads.settle()
+    handle = profile_handle(url)
+    profile = payloads.profile(handle)
+    if profile is None:
+        profile = await get_profile_info(page)
+    if profile is None:
+        await page.close()
+        early_json = {
+            "profile": {},
+            "posts": [],
+        }
+        await asyncio.to_thread(
+            write_json, f"{folder_path}/{uid}.json", early_json, 4
+        )
+        return early_json
+
+    # The timeline payload lists the grid, scrolling it is the fallback
+    all_posts = [
+        f"{IG_BASE_URL}/p/{shortcode}/"
+        for shortcode in payloads.shortcodes(handle)
+    ]
+    if not all_posts:
+        rows, is_public = await get_rows(page, min_rows=3, budget=budget)
+        profile.setdefault("is_public", is_public)
+
+        for row in rows:
+            curr_posts = await row.query_selector_all("a")
+            for post in curr_posts:
+                href = await post.get_attribute("href")
+                final_href = f"{IG_BASE_URL}{href}"
+                all_posts.append(final_href)
+    profile.setdefault("is_public", True)
+
+    # Only new posts and a sample of known ones are opened, the rest
+    # comes from the profile's snapshot
+    all_posts = budget.take_posts(all_posts)
+    shortcodes = [last_path_segment(post) for post in all_posts]
+    to_open = set(
+        await asyncio.to_thread(post_snapshots.plan, handle, shortcodes)
+    )
+    post_urls = [
+        post
+        for post, shortcode in zip(all_posts, shortcodes)
+        if shortcode in to_open
+    ]
+    posts_info = await get_posts_info(
+        browser,
+        pacer,
+        request_filter,
+        payloads,
+        post_urls,
+        post_tabs or POST_TABS or pacer.post_tabs,
+        budget,
+    )
+    fetched = {
+        last_path_segment(post): info
+        for post, info in zip(post_urls, posts_info)
+        if info is not None
+    }
+    # Waits on the handle's file lock
+    delta, posts = await asyncio.to_thread(
+        post_snapshots.update, handle, profile, shortcodes, fetched
+    )
+    print(
+        f"Posts leídos {len(fetched)}/{len(shortcodes)}, "
+        f"nuevos {len(delta['new'])}, cambiados {len(delta['changed'])}"
+    )
 
     final_json = {
-        "profile": {
-            "name": name,
-            "description": parsed_description,
-            "is_verified": is_verified,
-            "post_num": post_num,
-            "follower_num": follower_num,
-            "following_num": following_num,
-            "is_public": is_public,
-        },
-        "posts": posts_info,
+        "profile": profile,
+        "posts": posts,
+        "delta": delta,
+        # Set when a budget limit cut the scrape short
+        "partial": budget.partial,
+        "budget": budget.summary(),
     }
 
-    with open(f"{folder_path}/{uid}.json", "w", encoding="utf-8") as f:
-        json.dump(final_json, f, indent=2, ensure_ascii=False)
+    await asyncio.to_thread(
+        write_json, f"{folder_path}/{uid}.json", final_json, 2
+    )
 
     print(f"Scraping results saved in {folder_path}/{uid}.json")
+    print(f"Request filter instagram: {request_filter.summary()}")
+    print(f"Instagram payloads: {payloads.summary()}")
+    count_bytes("instagram", request_filter.stats["allowed_bytes"])
 
     await page.close()
 
     return final_json
 
 
-async def scrape_instagram_wrapper(browser, ig_url, uid):
+async def scrape_instagram_wrapper(
+    browser, ig_url, uid, pacing="fast", post_tabs=None
+):
     try:
-        return await scrape_instagram(browser, ig_url, uid)
+        return await scrape_instagram(browser, ig_url, uid, pacing, post_tabs)
     except Exception as e:
         print(e)
         return {
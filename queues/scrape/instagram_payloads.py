@@ -0,0 +1,271 @@
+"""
+Profile and post data read from the JSON Instagram's web client fetches
+(web_profile_info, the GraphQL queries and the v1 media endpoints)
+instead of from the obfuscated DOM. Payloads are walked generically:
+any dict shaped like a user, a media item or a comment is picked up,
+whichever endpoint it came in, so a renamed query keeps working as long
+as the objects keep their fields.
+"""
+
+import asyncio
+import re
+from datetime import datetime
+
+from .dates import days_since
+
+API_MARKERS = ["/api/v1/", "/graphql", "/api/graphql"]
+MEDIA_COMMENTS = re.compile(r"/media/(\d+)(?:_\d+)?/comments")
+
+
+def _count(value):
+    # GraphQL wraps counts as {"count": n}, the v1 API uses plain ints
+    if isinstance(value, dict):
+        value = value.get("count")
+    return value if isinstance(value, int) else None
+
+
+def _first(data, *keys):
+    for key in keys:
+        if data.get(key) is not None:
+            return data[key]
+    return None
+
+
+def _caption(media):
+    caption = media.get("caption")
+    if isinstance(caption, dict):
+        return caption.get("text") or ""
+    if isinstance(caption, str):
+        return caption
+    edges = (media.get("edge_media_to_caption") or {}).get("edges") or []
+    if edges:
+        return edges[0].get("node", {}).get("text") or ""
+    return ""
+
+
+def _nodes(value):
+    if isinstance(value, dict):
+        value = value.get("edges")
+    for item in value or []:
+        if isinstance(item, dict):
+            yield item.get("node", item)
+
+
+def _is_user(data):
+    return isinstance(data.get("username"), str) and (
+        "edge_followed_by" in data or "follower_count" in data
+    )
+
+
+def _is_media(data):
+    return ("shortcode" in data or "code" in data) and (
+        "taken_at_timestamp" in data or "taken_at" in data
+    )
+
+
+def _has_all_comments(media, comments, parsed):
+    if isinstance(comments, dict):
+        page_info = comments.get("page_info") or {}
+        if "has_next_page" in page_info:
+            return not page_info["has_next_page"]
+    count = _count(comments) if isinstance(comments, dict) else None
+    if count is None:
+        count = media.get("comment_count")
+    return isinstance(count, int) and len(parsed) >= count
+
+
+def parse_comment(data):
+    text = data.get("text")
+    likes = _count(
+        _first(data, "comment_like_count", "edge_liked_by", "like_count")
+    )
+    if text is None or likes is None:
+        return None
+    return {"comment": text, "likes": likes}
+
+
+class InstagramPayloads:
+    """Collects the JSON responses of the pages it is attached to."""
+
+    def __init__(self):
+        self.users = {}
+        self.media = {}
+        self.comments = {}
+        # Posts whose whole comment list has arrived, not just a page
+        self.complete = set()
+        self.timeline = {}
+        self.media_ids = {}
+        self.responses = 0
+        self._pending = set()
+
+    def attach(self, page):
+        page.on("response", self._on_response)
+        return self
+
+    async def settle(self, timeout=5):
+        """Wait for the responses already received to be parsed."""
+        if self._pending:
+            await asyncio.wait(list(self._pending), timeout=timeout)
+
+    def profile(self, username):
+        user = self.users.get(username.lower())
+        if user is None:
+            return None
+        counts = [
+            _count(
+                _first(user, "edge_owner_to_timeline_media", "media_count")
+            ),
+            _count(_first(user, "edge_followed_by", "follower_count")),
+            _count(_first(user, "edge_follow", "following_count")),
+        ]
+        if None in counts:
+            return None
+        post_num, follower_num, following_num = counts
+        return {
+            "name": user["username"],
+            "description": (user.get("biography") or "")
+            .strip()
+            .replace("\n", " "),
+            "is_verified": bool(user.get("is_verified")),
+            "post_num": str(post_num),
+            "follower_num": str(follower_num),
+            "following_num": str(following_num),
+            "is_public": not user.get("is_private", False),
+        }
+
+    def summary(self):
+        return {
+            "responses": self.responses,
+            "users": len(self.users),
+            "media": len(self.media),
+            "posts_with_comments": len(self.comments),
+        }
+
+    def shortcodes(self, username):
+        """The user's posts in grid order, as far as the payloads go."""
+        return self.timeline.get(username.lower(), [])
+
+    def post(self, shortcode):
+        """Post info in the final_json shape, once its comments arrived."""
+        media = self.media.get(shortcode)
+        if media is None or shortcode not in self.complete:
+            return None
+        likes = _count(
+            _first(
+                media,
+                "like_count",
+                "edge_media_preview_like",
+                "edge_liked_by",
+            )
+        )
+        taken_at = _first(media, "taken_at_timestamp", "taken_at")
+        if likes is None or not isinstance(taken_at, int):
+            return None
+        posted = datetime.fromtimestamp(taken_at).date()
+        return {
+            "description": _caption(media).strip().replace("\n", " "),
+            "likes": str(likes),
+            "last_day": days_since(posted),
+            "comments": self.comments[shortcode],
+        }
+
+    def _on_response(self, response):
+        url = response.url
+        if not any(marker in url for marker in API_MARKERS):
+            return
+        if "json" not in response.headers.get("content-type", ""):
+            return
+        task = asyncio.ensure_future(self._read(response))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _read(self, response):
+        try:
+            data = await response.json()
+        except Exception:
+            return
+        self.responses += 1
+        self.collect(data)
+        # The v1 comments endpoint only names its media by id
+        media_id = MEDIA_COMMENTS.search(response.url)
+        shortcode = media_id and self.media_ids.get(media_id.group(1))
+        if shortcode and isinstance(data, dict):
+            self._add_comments(shortcode, data.get("comments") or [])
+            more = data.get("has_more_comments") or data.get(
+                "has_more_headload_comments"
+            )
+            if not more:
+                self.complete.add(shortcode)
+
+    def collect(self, data):
+        """Index every user, media and comment list found in a payload."""
+        if isinstance(data, list):
+            for item in data:
+                self.collect(item)
+            return
+        if not isinstance(data, dict):
+            return
+
+        if _is_user(data):
+            username = data["username"].lower()
+            self.users[username] = {**self.users.get(username, {}), **data}
+            timeline = data.get("edge_owner_to_timeline_media")
+            if timeline:
+                self._add_timeline(username, _nodes(timeline))
+        if _is_media(data):
+            self._add_media(data)
+
+        for key, value in data.items():
+            if key.endswith("timeline_graphql_connection"):
+                nodes = list(_nodes(value))
+                users = [
+                    (node.get("user") or node.get("owner") or {}).get(
+                        "username"
+                    )
+                    for node in nodes
+                ]
+                if users and users[0]:
+                    self._add_timeline(users[0], nodes)
+            if isinstance(value, (dict, list)):
+                self.collect(value)
+
+    def _add_timeline(self, username, nodes):
+        codes = self.timeline.setdefault(username.lower(), [])
+        for node in nodes:
+            shortcode = node.get("shortcode") or node.get("code")
+            if shortcode and shortcode not in codes:
+                codes.append(shortcode)
+
+    def _add_media(self, media):
+        shortcode = media.get("shortcode") or media.get("code")
+        if not shortcode:
+            return
+        self.media[shortcode] = {**self.media.get(shortcode, {}), **media}
+        media_id = str(media.get("pk") or media.get("id") or "")
+        if media_id:
+            self.media_ids[media_id.split("_")[0]] = shortcode
+        comments = _first(
+            media,
+            "edge_media_to_parent_comment",
+            "edge_media_to_comment",
+            "comments",
+        )
+        parsed = [parse_comment(node) for node in _nodes(comments)]
+        parsed = [comment for comment in parsed if comment]
+        if parsed:
+            self._add_comments(shortcode, parsed, parsed=True)
+        # Grid entries only carry a count and posts the first page, the
+        # rest is left to the DOM unless it is known to be all of them
+        if _has_all_comments(media, comments, parsed):
+            self.comments.setdefault(shortcode, [])
+            self.complete.add(shortcode)
+
+    def _add_comments(self, shortcode, comments, parsed=False):
+        if not parsed:
+            comments = [parse_comment(comment) for comment in comments]
+            comments = [comment for comment in comments if comment]
+        known = self.comments.setdefault(shortcode, [])
+        seen = {(comment["comment"], comment["likes"]) for comment in known}
+        for comment in comments:
+            if (comment["comment"], comment["likes"]) not in seen:
+                known.append(comment)
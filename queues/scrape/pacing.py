@@ -0,0 +1,67 @@
+import asyncio
+import random
+
+PACING_PROFILES = {
+    # Only waits on real page conditions, no artificial delays
+    "fast": dict(
+        type_delay=(0, 0),
+        jitter=(0, 0),
+        jitter_budget_ms=0,
+        post_tabs=3,
+    ),
+    # Human-like typing and pauses, capped per task by the jitter budget
+    "stealth": dict(
+        type_delay=(60, 140),
+        jitter=(150, 700),
+        jitter_budget_ms=15000,
+        post_tabs=1,
+    ),
+}
+
+JSF_OVERLAY = "#j_idt1210"
+
+
+class Pacer:
+    def __init__(self, profile="fast"):
+        self.name = profile
+        self.profile = PACING_PROFILES[profile]
+        self.jitter_spent_ms = 0
+        # Instagram post permalinks read in parallel
+        self.post_tabs = self.profile["post_tabs"]
+
+    def type_delay(self):
+        return random.randint(*self.profile["type_delay"])
+
+    async def type(self, handle, text):
+        await handle.type(text, delay=self.type_delay())
+
+    async def pause(self):
+        remaining = self.profile["jitter_budget_ms"] - self.jitter_spent_ms
+        if remaining <= 0:
+            return
+        delay = min(random.randint(*self.profile["jitter"]), remaining)
+        self.jitter_spent_ms += delay
+        await asyncio.sleep(delay / 1000)
+
+    async def jsf_idle(self, page, timeout=15000):
+        # PrimeFaces shows the blocking overlay while an AJAX call runs
+        try:
+            await page.wait_for_selector(
+                JSF_OVERLAY, state="hidden", timeout=timeout
+            )
+        except Exception:
+            pass
+
+    async def network_idle(self, page, timeout=10000):
+        try:
+            await page.wait_for_load_state("networkidle", timeout=timeout)
+        except Exception:
+            pass
+
+    async def selector(self, page, selector, state="visible", timeout=5000):
+        try:
+            return await page.wait_for_selector(
+                selector, state=state, timeout=timeout
+            )
+        except Exception:
+            return None
@@ -0,0 +1,133 @@
+import re
+from collections import Counter
+from urllib.parse import urlparse
+
+TRACKING_DOMAINS = [
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "connect.facebook.net",
+    "hotjar.com",
+]
+
+POLICIES = {
+    "supercias": dict(
+        block_types=["image", "media", "font"],
+        block_domains=TRACKING_DOMAINS,
+        # Captcha images come from PrimeFaces dynamic content, statements
+        # from the documento servlet.
+        allow_patterns=[r"captcha", r"dynamiccontent", r"documento"],
+    ),
+    "instagram": dict(
+        block_types=["image", "media", "font"],
+        block_domains=TRACKING_DOMAINS,
+        allow_patterns=[],
+    ),
+}
+
+FILTER_MODES = ["off", "measure", "block"]
+
+# The route matcher only sees the URL, so blocked resource types are
+# matched by extension first and confirmed by type in the handler
+TYPE_EXTENSIONS = {
+    "image": ["png", "jpg", "jpeg", "gif", "webp", "svg", "ico", "heic"],
+    "media": ["mp4", "webm", "m4a", "mp3", "ogg", "m3u8", "ts"],
+    "font": ["woff", "woff2", "ttf", "otf", "eot"],
+}
+
+
+class RequestFilter:
+    """
+    Aborts requests a site does not need. Only requests that may be
+    blocked are routed, so everything else keeps the browser's HTTP
+    cache. In "measure" mode nothing is routed and the bytes the policy
+    would have saved are counted instead.
+    """
+
+    def __init__(self, policy, mode="block"):
+        self.policy = POLICIES[policy]
+        self.mode = mode
+        self._allow = [
+            re.compile(pattern, re.I)
+            for pattern in self.policy["allow_patterns"]
+        ]
+        self._extensions = {
+            extension
+            for resource_type in self.policy["block_types"]
+            for extension in TYPE_EXTENSIONS.get(resource_type, [])
+        }
+        self.stats = {
+            "requests": 0,
+            "blocked_requests": 0,
+            "blocked_by_type": Counter(),
+            "allowed_bytes": 0,
+        }
+        if mode == "measure":
+            # Blocked requests never reach the network, so their size is
+            # only known when nothing is blocked
+            self.stats["blockable_bytes"] = 0
+
+    async def install(self, target):
+        # target may be a page or a whole browser context
+        if self.mode == "off":
+            return self
+        if self.mode == "block":
+            await target.route(self.may_block, self._handle)
+        target.on("request", self._on_request)
+        target.on("requestfinished", self._on_finished)
+        return self
+
+    def summary(self):
+        return {
+            **self.stats,
+            "blocked_by_type": dict(self.stats["blocked_by_type"]),
+        }
+
+    def may_block(self, url):
+        if any(pattern.search(url) for pattern in self._allow):
+            return False
+        parsed = urlparse(url)
+        host = parsed.hostname or ""
+        if any(host.endswith(d) for d in self.policy["block_domains"]):
+            return True
+        extension = parsed.path.rsplit(".", 1)[-1].lower()
+        return "/" not in extension and extension in self._extensions
+
+    def should_block(self, url, resource_type):
+        if any(pattern.search(url) for pattern in self._allow):
+            return False
+        host = urlparse(url).hostname or ""
+        if any(host.endswith(d) for d in self.policy["block_domains"]):
+            return True
+        return resource_type in self.policy["block_types"]
+
+    def _on_request(self, request):
+        self.stats["requests"] += 1
+        if self.mode == "measure" and self.should_block(
+            request.url, request.resource_type
+        ):
+            self._count_blocked(request)
+
+    def _count_blocked(self, request):
+        self.stats["blocked_requests"] += 1
+        self.stats["blocked_by_type"][request.resource_type] += 1
+
+    async def _handle(self, route, request):
+        if self.should_block(request.url, request.resource_type):
+            self._count_blocked(request)
+            await route.abort()
+            return
+        await route.continue_()
+
+    async def _on_finished(self, request):
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        size = sizes["responseBodySize"] + sizes["responseHeadersSize"]
+        if self.mode == "measure" and self.should_block(
+            request.url, request.resource_type
+        ):
+            self.stats["blockable_bytes"] += size
+        else:
+            self.stats["allowed_bytes"] += size
@@ -0,0 +1,113 @@
+import time
+import weakref
+
+from browser_pool import keep_page_open
+
+
+class SuperciasSession:
+    def __init__(self, page, request_filter):
+        self.page = page
+        self.request_filter = request_filter
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.lookups = 0
+        self.captcha_skips = 0
+
+    def age(self):
+        return time.time() - self.created_at
+
+    def idle(self):
+        return time.time() - self.last_used
+
+
+class SessionManager:
+    """
+    One warm Supercias page per browser context, kept open between
+    lookups together with its request filter. While the server keeps the
+    session alive the next RUC reuses its cookies and storage and, if the
+    site allows it, skips the captcha.
+    """
+
+    def __init__(self, max_age, idle_timeout, max_lookups):
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self.max_lookups = max_lookups
+        # Contexts recycled by the browser pool drop their session with them
+        self._sessions = weakref.WeakKeyDictionary()
+        self._counters = {
+            "created": 0,
+            "reused": 0,
+            "expired": 0,
+            "failed": 0,
+            "lookups": 0,
+            "captcha_skips": 0,
+        }
+
+    async def checkout(self, context, new_filter):
+        session = self._sessions.get(context)
+        if session and self._is_valid(session):
+            self._counters["reused"] += 1
+            return session
+        if session:
+            self._counters["expired"] += 1
+            await self._close(context, session)
+
+        page = await context.new_page()
+        keep_page_open(page)
+        session = SuperciasSession(page, await new_filter().install(page))
+        self._sessions[context] = session
+        self._counters["created"] += 1
+        return session
+
+    async def checkin(self, context, session, captcha_skipped, ok=True):
+        session.last_used = time.time()
+        session.lookups += 1
+        self._counters["lookups"] += 1
+        if captcha_skipped:
+            session.captcha_skips += 1
+            self._counters["captcha_skips"] += 1
+        if not ok:
+            # Unknown page state, the next lookup starts from scratch
+            self._counters["failed"] += 1
+            await self._close(context, session)
+
+    def stats(self):
+        lookups = self._counters["lookups"]
+        checkouts = self._counters["created"] + self._counters["reused"]
+        return {
+            **self._counters,
+            "reuse_rate": (
+                round(self._counters["reused"] / checkouts, 3)
+                if checkouts
+                else None
+            ),
+            "captcha_skip_rate": (
+                round(self._counters["captcha_skips"] / lookups, 3)
+                if lookups
+                else None
+            ),
+            "sessions": [
+                {
+                    "age_seconds": round(session.age(), 1),
+                    "idle_seconds": round(session.idle(), 1),
+                    "lookups": session.lookups,
+                    "captcha_skips": session.captcha_skips,
+                }
+                for session in list(self._sessions.values())
+            ],
+        }
+
+    def _is_valid(self, session):
+        return (
+            not session.page.is_closed()
+            and session.age() < self.max_age
+            and session.idle() < self.idle_timeout
+            and session.lookups < self.max_lookups
+        )
+
+    async def _close(self, context, session):
+        self._sessions.pop(context, None)
+        try:
+            await session.page.close()
+        except Exception:
+            pass
@@ -1,42 +1,98 @@
-import asyncio
 import os
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
+import asyncio
+import base64
+import httpx
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from config import general_settings
+from llm_gateway import llm
+from metrics import span, timed, count_bytes
+from pdf_store import pdf_store
+from .routing import RequestFilter
+from .pacing import Pacer
+from .captcha import CaptchaSolver
+from .sessions import SessionManager
+from .supercias_http import (
+    SuperciasHttpClient,
+    SuperciasHttpError,
+    fetch_pdf,
+    session_client,
+)
 
 
-API_KEY = general_settings.API_KEY
+REQUEST_FILTER_MODE = general_settings.REQUEST_FILTER_MODE
+SUPERCIAS_CLIENT = general_settings.SUPERCIAS_CLIENT
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 folder_path = os.path.join(parent_dir, "generated")
 
 
-llm = ChatOpenAI(
-    model="gpt-4.1",
-    openai_api_key=API_KEY,
-    temperature=0.2,
+captcha_solver = CaptchaSolver(
+    llm,
+    mode=general_settings.CAPTCHA_OCR_BACKEND,
+    min_confidence=general_settings.CAPTCHA_MIN_CONFIDENCE,
+    collect_samples=general_settings.CAPTCHA_COLLECT_SAMPLES,
+)
+
+supercias_sessions = SessionManager(
+    max_age=general_settings.SUPERCIAS_SESSION_MAX_AGE,
+    idle_timeout=general_settings.SUPERCIAS_SESSION_IDLE_TIMEOUT,
+    max_lookups=general_settings.SUPERCIAS_SESSION_MAX_LOOKUPS,
 )
 
 base_url = (
     "https://appscvsgen.supercias.gob.ec/consultaCompanias/"
     + "societario/busquedaCompanias.jsf"
 )
-pdf_doc = {}
+DOCUMENT_TIMEOUT = 20000
+DOCUMENT_TAB_TIMEOUT = 10000
+STATEMENTS = [
+    ("state", "BALANCE", -1),
+    ("flujo", "FLUJO", -2),
+    ("integral", "INTEGRAL", -2),
+]
+
 
+def is_document(response):
+    return "documento" in response.url
 
-async def download_pdf(page, url_pdf, output_path):
-    response = await page.request.get(url_pdf)
-    if response.ok:
-        content = await response.body()
-        with open(output_path, "wb") as f:
-            f.write(content)
-        print(f"PDF descargado en {output_path}")
-    else:
-        print(f"Error al descargar PDF: {response.status}")
 
+async def download_pdf(page, url_pdf, uid, ruc, kind):
+    # Stream straight into the PDF store with the session's cookies
+    # instead of buffering the body through page.request
+    async with await session_client(page) as client:
+        return await fetch_pdf(client, url_pdf, uid, ruc, kind)
 
-async def get_file(page, uid, query: str, row: int):
+
+async def scrape_documents_http(page, uid, ruc):
+    """Replay the documents flow without the browser, None to fall back."""
+    try:
+        async with span("supercias_http"):
+            client = await SuperciasHttpClient.from_page(page)
+            async with client:
+                await client.open_documents()
+                await client.open_economic_tab()
+                downloads = {}
+                try:
+                    for key, query, row in STATEMENTS:
+                        url = await client.document_url(query, row)
+                        if url:
+                            downloads[key] = asyncio.create_task(
+                                client.fetch(url, uid, ruc, query.lower())
+                            )
+                finally:
+                    blobs = await wait_downloads(downloads)
+        print(f"Documentos por HTTP en {client.requests} requests")
+        return statement_files(uid, blobs)
+    except (SuperciasHttpError, httpx.HTTPError) as e:
+        print(f"Cliente HTTP sin éxito, sigue el navegador: {e}")
+        return None
+
+
+@timed("supercias_get_file")
+async def get_file(
+    page, pacer, uid, ruc, key, query: str, row: int, downloads
+):
     search_input = await page.query_selector(
         "input#frmInformacionCompanias\\:tabViewDocumentacion\\:"
         + "tblDocumentosEconomicos\\:j_idt969\\:filter"
@@ -44,9 +100,9 @@ async def get_file(page, uid, query: str, row: int):
     await search_input.click()
     await search_input.press("Control+A")  # Seleccionar todo
     await search_input.press("Backspace")  # Borrar
-    await search_input.type(query, delay=100)
+    await pacer.type(search_input, query)
 
-    await process_loading(page)
+    await process_loading(page, pacer)
 
     await page.wait_for_selector(
         "#frmInformacionCompanias\\:tabViewDocumentacion\\:"
@@ -62,7 +118,7 @@ async def get_file(page, uid, query: str, row: int):
     if classes and "ui-state-disabled" not in classes:
         await last_page.click()
 
-    await process_loading(page)
+    await process_loading(page, pacer)
 
     rows = []
     try:
@@ -77,32 +133,41 @@ async def get_file(page, uid, query: str, row: int):
         )
         last_balance = rows[row]
         pdf_link = await last_balance.query_selector("a")
-        await pdf_link.click()
     except Exception:
         print("No tiene balance")
         return None
 
-    await process_loading(page)
-
-    await asyncio.sleep(2)
+    # Take the documento response triggered by this click on this page,
+    # so sessions sharing a worker never see each other's statements.
+    document_url = None
+    try:
+        async with page.expect_response(
+            is_document, timeout=DOCUMENT_TIMEOUT
+        ) as document:
+            await pdf_link.click()
+            await process_loading(page, pacer)
+            await page.wait_for_selector("div#dlgPresentarDocumentoPdf a")
+        document_url = (await document.value).url
+    except PlaywrightTimeoutError:
+        print(f"No llegó el documento {query}")
 
     parsed_search_input = query.lower()
 
-    if pdf_doc[uid]:
-        await download_pdf(
-            page,
-            pdf_doc[uid],
-            f"{folder_path}/{uid}-{parsed_search_input}.pdf",
+    if document_url:
+        # Fire the download while the dialog still holds this document and
+        # let it stream while the next statement is being looked up.
+        downloads[key] = asyncio.create_task(
+            download_pdf(page, document_url, uid, ruc, parsed_search_input)
         )
 
-    await page.wait_for_selector("div#dlgPresentarDocumentoPdf a")
     close_btn = await page.query_selector("div#dlgPresentarDocumentoPdf a")
-    await close_btn.click()
-
-    return f"{uid}-{parsed_search_input}.pdf"
+    if close_btn and await close_btn.is_visible():
+        await close_btn.click()
+    await pacer.pause()
 
 
-async def supercias_ocr(llm, image_jshandle):
+@timed("supercias_ocr")
+async def supercias_ocr(image_jshandle):
     img_b64 = await image_jshandle.evaluate(
         """
             img => {
@@ -115,92 +180,71 @@ async def supercias_ocr(llm, image_jshandle):
             }
         """
     )
-    message = HumanMessage(
-        content=[
-            {
-                "type": "text",
-                "text": "Eres un OCR, dame el texto que veas en la imagen, "
-                + "solo el texto, no hay que dar explicaciones",
-            },
-            {
-                "type": "image_url",
-                "image_url": {"url": f"data:image/png;base64,{img_b64}"},
-            },
-        ]
-    )
+    return await captcha_solver.solve(base64.b64decode(img_b64))
 
-    response = llm.invoke([message])
-    return response.content
 
+async def process_loading(page, pacer):
+    await pacer.jsf_idle(page)
 
-async def process_loading(page):
-    await asyncio.sleep(0.2)
-    try:
-        await page.wait_for_selector("#j_idt1210", state="hidden")
-    except Exception:
-        pass
-
-    await asyncio.sleep(0.2)
+    # The captcha dialog is opened by the AJAX response itself, so once the
+    # overlay is gone it is either visible already or not coming.
+    input_text = await page.query_selector(
+        "div#dlgCaptcha input#frmCaptcha\\:captcha"
+    )
+    if not input_text or not await input_text.is_visible():
+        return
     try:
-        input_text = await page.wait_for_selector(
-            "div#dlgCaptcha input#frmCaptcha\\:captcha", timeout=1500
-        )
         image_captcha = await page.wait_for_selector(
             "div#dlgCaptcha img#frmCaptcha\\:captchaImage", timeout=1500
         )
-        captcha_text = await supercias_ocr(llm, image_captcha)
-        await input_text.type(captcha_text, delay=100)
+        answer = await supercias_ocr(image_captcha)
+        await pacer.type(input_text, answer.text)
         await page.keyboard.press("Enter")
     except Exception:
-        pass
-
-    await asyncio.sleep(0.2)
-    try:
-        await page.wait_for_selector("#j_idt1210", state="hidden")
-    except Exception:
-        pass
-
-
-async def scrape_supercias(browser, ruc, uid):
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-
-    page = await browser.new_page()
-
-    def handle_request(request):
-        url = request.url
+        answer = None
 
-        if "documento" in url:
-            pdf_doc[uid] = url
+    await pacer.jsf_idle(page)
+    if answer and not await input_text.is_visible():
+        await asyncio.to_thread(captcha_solver.accepted, answer)
 
-    page.on("request", handle_request)
 
+async def open_company(page, pacer, ruc):
+    """Search the RUC and get past the captcha, True if it was skipped."""
+    # Reloading the search keeps the server session; staying on the page
+    # would leave the previous company's menu around.
     await page.goto(base_url)
 
-    radio_blanks = await page.query_selector_all(
-        ".ui-radiobutton-icon.ui-icon.ui-c.ui-icon-blank"
-    )
-    await radio_blanks[0].click()
+    # On a reused page the RUC radio may already be selected
+    ruc_radio = await page.query_selector(".ui-radiobutton-icon.ui-icon.ui-c")
+    if "ui-icon-blank" in (await ruc_radio.get_attribute("class") or ""):
+        await ruc_radio.click()
     print("Clickeando RUC")
 
-    await asyncio.sleep(0.2)
+    await pacer.pause()
 
     text_input = await page.query_selector("input[type='text']")
-    await text_input.type(ruc, delay=100)
+    await text_input.fill("")
+    await pacer.type(text_input, ruc)
     print("Escribiendo RUC")
 
-    await asyncio.sleep(0.2)
-
-    first_li_result = await page.query_selector("ul li")
+    first_li_result = await page.wait_for_selector("ul li", state="visible")
+    await pacer.pause()
     await first_li_result.click()
     print("Seleccionando 1er resultado del autocomplete")
 
-    await asyncio.sleep(0.2)
+    await pacer.jsf_idle(page)
+
+    # A session the site still trusts goes straight to the company
+    menu = page.locator("#frmMenu\\:menuDocumentacion")
+    await menu.or_(page.locator("table img").last).wait_for(timeout=30000)
+    if await menu.is_visible():
+        print("Sesión reutilizada, sin captcha")
+        return True
 
     all_images = await page.query_selector_all("table img")
     ocr_img = all_images[-1]
 
-    ocr_text = await supercias_ocr(llm, ocr_img)
+    answer = await supercias_ocr(ocr_img)
     tbody_handle = await ocr_img.evaluate_handle(
         """
         async (el) => {
@@ -213,7 +257,7 @@ async def scrape_supercias(browser, ruc, uid):
         """
     )
     ocr_input = await tbody_handle.query_selector("input[type='text']")
-    await ocr_input.type(ocr_text, delay=50)
+    await pacer.type(ocr_input, answer.text)
     print("Escribiendo el texto ocr")
 
     button_span = await page.query_selector(".ui-button-text.ui-c")
@@ -221,13 +265,37 @@ async def scrape_supercias(browser, ruc, uid):
     await parent_span.click()
     print("Clickeando boton verificar")
 
-    await asyncio.sleep(0.2)
+    await menu.wait_for()
+    await asyncio.to_thread(captcha_solver.accepted, answer)
+    return False
+
 
+async def wait_downloads(downloads):
+    """Blob of every download that stored its PDF, by statement key."""
+    keys = list(downloads)
+    results = await asyncio.gather(*downloads.values(), return_exceptions=True)
+    blobs = {}
+    for key, result in zip(keys, results):
+        if isinstance(result, Exception):
+            print(f"Falló la descarga de {key}: {result}")
+        elif result:
+            blobs[key] = result
+    return blobs
+
+
+def statement_files(uid, blobs):
+    return {
+        key: f"{uid}-{query.lower()}.pdf" if key in blobs else None
+        for key, query, _ in STATEMENTS
+    }
+
+
+async def open_documents(page, pacer):
     online_docs = await page.wait_for_selector("#frmMenu\\:menuDocumentacion")
     await online_docs.click()
     print("Clickeando Documentos onlines")
 
-    await process_loading(page)
+    await process_loading(page, pacer)
 
     economic_docs = await page.wait_for_selector(
         "#frmInformacionCompanias\\:tabViewDocumentacion\\:j_idt964"
@@ -235,22 +303,121 @@ async def scrape_supercias(browser, ruc, uid):
     await economic_docs.click()
     print("Clickeando Documentos economicos")
 
-    await process_loading(page)
+    await process_loading(page, pacer)
 
-    state_file = await get_file(page, uid, "BALANCE", -1)
-    flujo_file = await get_file(page, uid, "FLUJO", -2)
-    integral_file = await get_file(page, uid, "INTEGRAL", -2)
 
-    return {
-        "state": state_file,
-        "flujo": flujo_file,
-        "integral": integral_file,
-    }
+async def open_document_tab(page, pacer, request_filter):
+    """Another view of the company in the same session, None if refused."""
+    tab = None
+    try:
+        tab = await page.context.new_page()
+        await request_filter.install(tab)
+        await tab.goto(page.url)
+        await tab.wait_for_selector(
+            "#frmMenu\\:menuDocumentacion", timeout=DOCUMENT_TAB_TIMEOUT
+        )
+        await open_documents(tab, pacer)
+        return tab
+    except BaseException as e:
+        # Also closes a tab still loading when its opening is cancelled
+        if tab:
+            await tab.close()
+        if not isinstance(e, Exception):
+            raise
+        print(f"Pestaña de documentos no disponible: {e}")
+        return None
+
+
+async def scrape_documents_browser(page, pacer, uid, ruc, request_filter):
+    # The main page starts on the statements right away. Extra tabs of
+    # the same session, each a JSF view with its own table filter, join
+    # in as they open; the site may not open the company again without
+    # the search and the captcha, and then the main page does them all.
+    await open_documents(page, pacer)
+    pending, downloads = list(STATEMENTS), {}
+    tabs, opening = [], set()
+
+    async def lookup(target):
+        while pending:
+            key, query, row = pending.pop(0)
+            try:
+                await get_file(
+                    target, pacer, uid, ruc, key, query, row, downloads
+                )
+            except Exception as e:
+                # This view is in an unknown state, leave the rest to the
+                # others
+                print(f"Falló la búsqueda de {query}: {e}")
+                return
+
+    async def extra_tab():
+        tab = await open_document_tab(page, pacer, request_filter)
+        opening.discard(asyncio.current_task())
+        if tab:
+            tabs.append(tab)
+            await lookup(tab)
+
+    workers = [asyncio.create_task(extra_tab()) for _ in STATEMENTS[1:]]
+    opening.update(workers)
+    try:
+        await lookup(page)
+        if not pending:
+            # Tabs still loading have nothing left to look up
+            for worker in opening:
+                worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        blobs = await wait_downloads(downloads)
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for tab in tabs:
+            await tab.close()
+    return statement_files(uid, blobs)
+
+
+async def scrape_supercias(browser, ruc, uid, pacing="fast"):
+    pacer = Pacer(pacing)
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+    await asyncio.to_thread(pdf_store.clear, "uid", uid)
+
+    session = await supercias_sessions.checkout(
+        browser, lambda: RequestFilter("supercias", REQUEST_FILTER_MODE)
+    )
+    page = session.page
+    request_filter = session.request_filter
+    allowed_bytes = request_filter.stats["allowed_bytes"]
+    captcha_skipped = False
+
+    try:
+        captcha_skipped = await open_company(page, pacer, ruc)
+
+        files = None
+        if SUPERCIAS_CLIENT == "http":
+            files = await scrape_documents_http(page, uid, ruc)
+        if files is None:
+            files = await scrape_documents_browser(
+                page, pacer, uid, ruc, request_filter
+            )
+    except Exception:
+        await supercias_sessions.checkin(
+            browser, session, captcha_skipped, ok=False
+        )
+        raise
+    await supercias_sessions.checkin(browser, session, captcha_skipped)
+
+    print(f"Filtro de requests supercias: {request_filter.summary()}")
+    count_bytes(
+        "supercias", request_filter.stats["allowed_bytes"] - allowed_bytes
+    )
+
+    return files
 
 
-async def scrape_supercias_wrapper(browser, ruc, uid):
+async def scrape_supercias_wrapper(browser, ruc, uid, pacing="fast"):
     try:
-        return await scrape_supercias(browser, ruc, uid)
+        return await scrape_supercias(browser, ruc, uid, pacing)
     except Exception as e:
         print(e)
         return {
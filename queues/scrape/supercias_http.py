@@ -0,0 +1,303 @@
+"""
+Browserless replay of the Supercias documents flow.
+
+Once the captcha is solved everything up to the statement PDF is plain
+PrimeFaces AJAX: each click posts the form with the javax.faces.partial.*
+fields and the current javax.faces.ViewState, and the server answers with
+a <partial-response> holding the updated fragments. This client replays
+those posts with the browser session's cookies and hands back to the
+browser (SuperciasHttpError) whenever the site asks for another captcha
+or answers something it does not recognise.
+"""
+
+import asyncio
+import html
+import json
+import re
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from urllib.parse import urljoin
+
+import httpx
+
+from metrics import count_bytes
+from pdf_store import pdf_store
+
+VIEW_STATE = "javax.faces.ViewState"
+FORM = "frmInformacionCompanias"
+MENU_DOCUMENTS = "frmMenu:menuDocumentacion"
+TAB_VIEW = f"{FORM}:tabViewDocumentacion"
+ECONOMIC_TAB = f"{TAB_VIEW}:j_idt964"
+TABLE = f"{TAB_VIEW}:tblDocumentosEconomicos"
+TABLE_FILTER = f"{TABLE}:j_idt969:filter"
+CAPTCHA_MARKERS = ["dlgCaptcha", "frmCaptcha"]
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+PartialResponse = namedtuple(
+    "PartialResponse", ["updates", "view_state", "args", "scripts"]
+)
+
+
+class SuperciasHttpError(Exception):
+    pass
+
+
+class CaptchaRequired(SuperciasHttpError):
+    pass
+
+
+def parse_partial_response(text):
+    """Split a <partial-response> into updates, ViewState, args, evals."""
+    try:
+        root = ET.fromstring(text)
+    except ET.ParseError as e:
+        raise SuperciasHttpError(f"Not a partial response: {e}")
+    if root.tag != "partial-response":
+        raise SuperciasHttpError(f"Unexpected response <{root.tag}>")
+    error = root.find("error")
+    if error is not None:
+        name = error.findtext("error-name")
+        raise SuperciasHttpError(f"{name}: {error.findtext('error-message')}")
+    if root.find("redirect") is not None:
+        raise SuperciasHttpError("Session redirected, view expired")
+
+    updates, view_state, args = {}, None, {}
+    for update in root.iter("update"):
+        component_id = update.get("id", "")
+        if VIEW_STATE in component_id:
+            view_state = update.text
+        else:
+            updates[component_id] = update.text or ""
+    # Callback params such as the filtered totalRecords
+    for extension in root.iter("extension"):
+        if extension.get("type") == "args" and extension.text:
+            try:
+                args.update(json.loads(extension.text))
+            except ValueError:
+                pass
+    scripts = [script.text or "" for script in root.iter("eval")]
+    return PartialResponse(updates, view_state, args, scripts)
+
+
+def find_ajax_call(markup, element_id):
+    """Read the PrimeFaces.ab({...}) config from an element's onclick."""
+    tag = re.search(
+        r"<[^>]*\bid=\"" + re.escape(element_id) + r"\"[^>]*>", markup
+    )
+    if not tag:
+        raise SuperciasHttpError(f"{element_id} not found")
+    onclick = re.search(r"onclick=\"([^\"]*)\"", tag.group(0))
+    call = onclick and re.search(
+        r"PrimeFaces\.ab\(\{(.*?)\}\)", html.unescape(onclick.group(1))
+    )
+    if not call:
+        raise SuperciasHttpError(f"{element_id} does not post AJAX")
+    return dict(re.findall(r"(\w+):\s*[\"']([^\"']*)[\"']", call.group(1)))
+
+
+def table_page_size(markup):
+    widget = re.search(
+        r"PrimeFaces\.cw\(\"DataTable\"[^;]*?" + re.escape(TABLE) + r"[^;]*",
+        markup,
+    )
+    size = widget and re.search(r"\brows:\s*(\d+)", widget.group(0))
+    return int(size.group(1)) if size else None
+
+
+def table_rows(markup):
+    body = re.search(
+        r"<tbody[^>]*id=\"" + re.escape(f"{TABLE}_data") + r"\"[^>]*>"
+        r"(.*?)</tbody>",
+        markup,
+        re.S,
+    )
+    source = body.group(1) if body else markup
+    return re.findall(r"<tr[^>]*>(.*?)</tr>", source, re.S)
+
+
+async def fetch_pdf(client, url, uid, ruc, kind):
+    """Stream a statement into the PDF store and link it for the parser."""
+    async with client.stream("GET", url) as response:
+        if response.status_code != 200:
+            print(f"Error al descargar PDF: {response.status_code}")
+            return None
+        blob = await pdf_store.put_stream(
+            response.aiter_bytes(DOWNLOAD_CHUNK_SIZE)
+        )
+    count_bytes("supercias", blob["size"])
+    await asyncio.to_thread(pdf_store.record, uid, ruc, kind, blob)
+    output_path = await asyncio.to_thread(
+        pdf_store.link, blob["sha256"], uid, kind
+    )
+    print(f"PDF descargado en {output_path} ({blob['sha256'][:12]})")
+    return blob
+
+
+async def session_client(page):
+    """An httpx client carrying the page's cookies and user agent."""
+    cookies = await page.context.cookies(page.url)
+    return httpx.AsyncClient(
+        cookies={cookie["name"]: cookie["value"] for cookie in cookies},
+        headers={
+            "User-Agent": await page.evaluate("navigator.userAgent"),
+            "Referer": page.url,
+        },
+        timeout=60,
+        follow_redirects=True,
+    )
+
+
+class SuperciasHttpClient:
+    def __init__(self, client, url, view_state, markup):
+        self.client = client
+        self.url = url
+        self.view_state = view_state
+        self.markup = markup
+        self.args = {}
+        self.requests = 0
+
+    @classmethod
+    async def from_page(cls, page):
+        view_state = await page.get_attribute(
+            f"input[name='{VIEW_STATE}']", "value"
+        )
+        if not view_state:
+            raise SuperciasHttpError("No ViewState on the page")
+        return cls(
+            await session_client(page),
+            page.url,
+            view_state,
+            await page.content(),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.client.aclose()
+
+    async def ajax(self, source, form, process, update, params=None):
+        data = {
+            "javax.faces.partial.ajax": "true",
+            "javax.faces.source": source,
+            "javax.faces.partial.execute": process,
+            "javax.faces.partial.render": update,
+            form: form,
+            VIEW_STATE: self.view_state,
+            **(params or {}),
+        }
+        response = await self.client.post(
+            self.url,
+            data=data,
+            headers={
+                "Faces-Request": "partial/ajax",
+                "X-Requested-With": "XMLHttpRequest",
+            },
+        )
+        self.requests += 1
+        response.raise_for_status()
+        partial = parse_partial_response(response.text)
+        if partial.view_state:
+            self.view_state = partial.view_state
+        self.args = partial.args
+        # The captcha dialog is opened by an update or a script in the
+        # response, only a browser can render and answer it
+        if any(
+            marker in text
+            for marker in CAPTCHA_MARKERS
+            for text in list(partial.updates) + partial.scripts
+        ):
+            raise CaptchaRequired("The site asked for a captcha")
+        # Later steps look their targets up in what has been rendered
+        self.markup += "".join(partial.updates.values())
+        return partial.updates
+
+    async def click(self, element_id, params=None):
+        call = find_ajax_call(self.markup, element_id)
+        source = call.get("s", element_id)
+        return await self.ajax(
+            source,
+            call.get("f", FORM),
+            call.get("p", source),
+            call.get("u", "@all"),
+            {source: source, **(params or {})},
+        )
+
+    async def open_documents(self):
+        await self.click(MENU_DOCUMENTS)
+
+    async def open_economic_tab(self):
+        tabs = re.findall(
+            r"href=\"#(" + re.escape(TAB_VIEW) + r":[^\"]+)\"", self.markup
+        )
+        if ECONOMIC_TAB not in tabs:
+            raise SuperciasHttpError("Economic documents tab not found")
+        await self.ajax(
+            TAB_VIEW,
+            FORM,
+            TAB_VIEW,
+            TAB_VIEW,
+            {
+                "javax.faces.behavior.event": "tabChange",
+                "javax.faces.partial.event": "tabChange",
+                f"{TAB_VIEW}_contentLoad": "true",
+                f"{TAB_VIEW}_newTab": ECONOMIC_TAB,
+                f"{TAB_VIEW}_tabindex": str(tabs.index(ECONOMIC_TAB)),
+            },
+        )
+
+    async def statement_rows(self, query):
+        """Filter the documents table and return the rows of its last page."""
+        table_params = {
+            TABLE_FILTER: query,
+            f"{TABLE}_encodeFeature": "true",
+        }
+        updates = await self.ajax(
+            TABLE,
+            FORM,
+            TABLE,
+            TABLE,
+            {f"{TABLE}_filtering": "true", **table_params},
+        )
+        markup = "".join(updates.values())
+        count = self.args.get("totalRecords")
+        size = table_page_size(self.markup)
+        if count and size:
+            first = (int(count) - 1) // size * size
+            if first:
+                updates = await self.ajax(
+                    TABLE,
+                    FORM,
+                    TABLE,
+                    TABLE,
+                    {
+                        f"{TABLE}_pagination": "true",
+                        f"{TABLE}_first": str(first),
+                        f"{TABLE}_rows": str(size),
+                        **table_params,
+                    },
+                )
+                markup = "".join(updates.values())
+        return table_rows(markup)
+
+    async def document_url(self, query, row):
+        rows = await self.statement_rows(query)
+        try:
+            link = re.search(r"<a[^>]*\bid=\"([^\"]+)\"", rows[row])
+        except IndexError:
+            return None
+        if not link:
+            return None
+        updates = await self.click(link.group(1))
+        source = re.search(
+            r"(?:src|data)=\"([^\"]*documento[^\"]*)\"",
+            "".join(updates.values()),
+        )
+        if not source:
+            raise SuperciasHttpError(f"No documento URL for {query}")
+        return urljoin(self.url, html.unescape(source.group(1)))
+
+    async def fetch(self, url, uid, ruc, kind):
+        return await fetch_pdf(self.client, url, uid, ruc, kind)
@@ -0,0 +1,121 @@
+import json
+import os
+import re
+import shutil
+import time
+from urllib.parse import urlparse
+
+STATEMENT_KINDS = ["balance", "flujo", "integral"]
+
+
+def instagram_handle(ig_url):
+    path = urlparse(ig_url).path if "://" in ig_url else ig_url
+    return path.strip("/").split("/")[0].lstrip("@").lower()
+
+
+class ScrapeCache:
+    """
+    Last scrape results per RUC (hashes of the statement PDFs in the PDF
+    store and their parsed values) and per Instagram handle (social JSON),
+    reused while younger than their TTL.
+    """
+
+    def __init__(
+        self, folder_path, generated_path, supercias_ttl, ig_ttl, pdf_store
+    ):
+        self.folder_path = folder_path
+        self.generated_path = generated_path
+        self.pdf_store = pdf_store
+        self.ttls = {"supercias": supercias_ttl, "instagram": ig_ttl}
+
+    def get_supercias(self, ruc):
+        return self._get("supercias", ruc)
+
+    def put_supercias(self, ruc, uid, files):
+        if not any(files.values()):
+            return
+        entry_path = self._entry_path("supercias", ruc)
+        os.makedirs(entry_path, exist_ok=True)
+        # The PDFs themselves live in the store, the entry keeps hashes
+        refs = self.pdf_store.refs("uid", uid)
+        stored = {kind: refs[kind] for kind in STATEMENT_KINDS if kind in refs}
+        self._write_meta(
+            entry_path, {"fetched_at": time.time(), "files": stored}
+        )
+
+    def put_statements(self, ruc, statements):
+        entry_path = self._entry_path("supercias", ruc)
+        meta = self._read_meta(entry_path)
+        if meta is None:
+            return
+        meta["statements"] = statements
+        self._write_meta(entry_path, meta)
+
+    def restore_supercias(self, ruc, uid):
+        entry_path = self._entry_path("supercias", ruc)
+        meta = self._read_meta(entry_path) or {}
+        self.pdf_store.clear("uid", uid)
+        for kind, ref in meta.get("files", {}).items():
+            if isinstance(ref, str):
+                # Entries written before the PDF store held copies
+                shutil.copyfile(
+                    os.path.join(entry_path, ref),
+                    os.path.join(self.generated_path, f"{uid}-{kind}.pdf"),
+                )
+                continue
+            self.pdf_store.link(ref["sha256"], uid, kind)
+            self.pdf_store.record(uid, None, kind, ref)
+        return meta
+
+    def get_instagram(self, ig_url):
+        return self._get("instagram", instagram_handle(ig_url))
+
+    def put_instagram(self, ig_url, uid, social):
+        # A scrape cut short by its budget is retried instead of reused
+        if not social.get("profile") or social.get("partial"):
+            return
+        entry_path = self._entry_path("instagram", instagram_handle(ig_url))
+        os.makedirs(entry_path, exist_ok=True)
+        shutil.copyfile(
+            os.path.join(self.generated_path, f"{uid}.json"),
+            os.path.join(entry_path, "social.json"),
+        )
+        self._write_meta(
+            entry_path,
+            {"fetched_at": time.time(), "posts": len(social["posts"])},
+        )
+
+    def restore_instagram(self, ig_url, uid):
+        entry_path = self._entry_path("instagram", instagram_handle(ig_url))
+        shutil.copyfile(
+            os.path.join(entry_path, "social.json"),
+            os.path.join(self.generated_path, f"{uid}.json"),
+        )
+        return self._read_meta(entry_path)
+
+    def _get(self, kind, key):
+        meta = self._read_meta(self._entry_path(kind, key))
+        if not meta:
+            return None
+        if time.time() - meta["fetched_at"] > self.ttls[kind]:
+            return None
+        return meta
+
+    def _entry_path(self, kind, key):
+        safe_key = re.sub(r"[^0-9A-Za-z._-]", "_", key)
+        return os.path.join(self.folder_path, kind, safe_key)
+
+    def _read_meta(self, entry_path):
+        try:
+            with open(
+                os.path.join(entry_path, "meta.json"), "r", encoding="utf-8"
+            ) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, entry_path, meta):
+        tmp_path = os.path.join(entry_path, "meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, os.path.join(entry_path, "meta.json"))